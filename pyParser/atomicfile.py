@@ -0,0 +1,52 @@
+# Atomic files
+# ------------
+#
+# The indexes, models and caches kept next to the datasets are replaced
+# atomically: written under a temporary name in the same directory and
+# renamed into place, so concurrent readers see either the old file or
+# the new one, never half of one. A write that fails removes its
+# temporary file instead of leaving it behind.
+
+import cPickle as pickle
+import os
+
+
+# Calls `write(f)` with a new binary file and moves it to `path` once
+# `write` returns; the directory is created if needed.
+def atomicWrite(path, write):
+  dir = os.path.dirname(path)
+  if dir and not os.path.exists(dir):
+    os.makedirs(dir)
+  tmp = "%s.%s.tmp" % (path, os.getpid())
+  done = False
+  try:
+    f = open(tmp, 'wb')
+    try:
+      write(f)
+    finally:
+      f.close()
+    os.rename(tmp, path)
+    done = True
+  finally:
+    if not done and os.path.exists(tmp):
+      os.remove(tmp)
+
+
+# Pickles `obj` to `path` atomically.
+def savePickle(path, obj):
+  atomicWrite(path, lambda f: pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL))
+
+
+# Returns the object pickled at `path`, or `default` if there is none or
+# it can't be read (truncated, or written by an incompatible version).
+def loadPickle(path, default=None):
+  try:
+    f = open(path, 'rb')
+  except IOError:
+    return default
+  try:
+    return pickle.load(f)
+  except Exception:
+    return default
+  finally:
+    f.close()
@@ -0,0 +1,210 @@
+# Language backends
+# -----------------
+#
+# The few language services `PoemParser` needs - tokenizing, n-grams and
+# POS tagging - behind one small interface, so rendering workers don't
+# have to import NLTK.
+#
+# `nltk` is the full-analysis backend. `lite` is pure Python: whitespace
+# tokenizing, `zip`-based n-grams and a lookup-table tagger.
+# Syllables come from the precompiled lexicon index with either backend.
+
+import os
+import re
+
+from tagcache import modelSignature
+
+
+#
+class NLTKBackend(object):
+
+  name = 'nltk'
+
+  #
+  def __init__(self):
+    self._tagger = None
+
+  #
+  def tokenize(self, text):
+    from nltk.tokenize import WhitespaceTokenizer
+    return WhitespaceTokenizer().tokenize(text)
+
+  #
+  def ngrams(self, tokens, n):
+    from nltk.util import ngrams
+    return ngrams(tokens, n)
+
+  # Returns the POS tagger, loading it on first use.
+  def tagger(self):
+    if self._tagger is None:
+      import nltk
+      try:
+        from nltk.tag.perceptron import PerceptronTagger
+        self._tagger = PerceptronTagger()
+      except ImportError:
+        # NLTK 2.x ships a pickled maxent tagger instead.
+        self._tagger = nltk.data.load(nltk.tag._POS_TAGGER)
+    return self._tagger
+
+  # `modelSignature` of the tagger, without loading its model if it isn't
+  # loaded yet: the perceptron tagger is identified by its class and the
+  # NLTK version alone.
+  def taggerSignature(self):
+    if self._tagger is not None:
+      return modelSignature(self._tagger)
+    import nltk
+    try:
+      from nltk.tag.perceptron import PerceptronTagger
+    except ImportError:
+      return modelSignature(self.tagger())
+    return "%s.%s/nltk-%s" % (PerceptronTagger.__module__, PerceptronTagger.__name__, nltk.__version__)
+
+  # Imports everything a full run needs.
+  def preload(self):
+    self.tagger()
+    import nltk.util, nltk.tokenize
+
+
+
+#
+class LiteBackend(object):
+
+  name = 'lite'
+
+  #
+  def __init__(self, table=None):
+    self.table   = table or DEFAULT_TAG_TABLE
+    self._tagger = None
+
+  # Same result as NLTK's `WhitespaceTokenizer`.
+  def tokenize(self, text):
+    return text.split()
+
+  #
+  def ngrams(self, tokens, n):
+    return zip(*[tokens[i:] for i in range(n)])
+
+  #
+  def tagger(self):
+    if self._tagger is None:
+      self._tagger = LookupTagger(self.table)
+    return self._tagger
+
+  # The tagger's signature, without reading its table.
+  def taggerSignature(self):
+    return tableSignature(self.table)
+
+  #
+  def preload(self):
+    self.tagger()
+
+
+
+# Lookup-table tagger
+# -------------------
+
+DEFAULT_TAG_TABLE = "pyParser/postags.tbl"
+
+# Closed-class words, so the tagger is usable even without a table.
+CLOSED_CLASS = dict(
+  [(w, 'DT')   for w in 'a an the this that these those every each no some any all'.split()] +
+  [(w, 'IN')   for w in 'of in on at by for with from into upon about over under after before since through like than'.split()] +
+  [(w, 'PRP')  for w in 'i me you he him she her it we us they them'.split()] +
+  [(w, 'PRP$') for w in 'my your his its our their'.split()] +
+  [(w, 'CC')   for w in 'and or but nor yet'.split()] +
+  [(w, 'MD')   for w in 'can could may might must shall should will would'.split()] +
+  [(w, 'VBZ')  for w in 'is has does'.split()] +
+  [(w, 'VBP')  for w in 'am are have do'.split()] +
+  [(w, 'VBD')  for w in 'was were had did'.split()] +
+  [('to', 'TO'), ('not', 'RB'), ('be', 'VB'), ('been', 'VBN'), ('there', 'EX')])
+
+# Penn Treebank guesses for words that aren't in either table.
+SUFFIX_TAGS = [
+  (r'^-?[0-9]+(\.[0-9]+)?$', 'CD'),
+  (r'.*ness$',               'NN'),
+  (r'.*able$',               'JJ'),
+  (r'.*ly$',                 'RB'),
+  (r'.*ing$',                'VBG'),
+  (r'.*ed$',                 'VBD'),
+  (r'.*s$',                  'NNS'),
+  (r'.*',                    'NN'),
+]
+
+
+# Identifies the `LookupTagger` built from the table at `path`.
+def tableSignature(path):
+  if os.path.exists(path):
+    return "backends.LookupTagger/%s" % int(os.stat(path).st_mtime)
+  return "backends.LookupTagger/rules"
+
+
+# Tags every word with its most frequent tag from a `word<TAB>tag` table
+# (see `buildTagTable`), falling back to closed-class words and suffix
+# rules.
+class LookupTagger(object):
+
+  #
+  def __init__(self, path=DEFAULT_TAG_TABLE):
+    self.table = {}
+    if os.path.exists(path):
+      with open(path) as f:
+        for line in f:
+          word, tag = line.rstrip('\n').split('\t')
+          self.table[word] = tag
+    self.signature = tableSignature(path)
+    self.rules = [(re.compile(pattern), tag) for pattern, tag in SUFFIX_TAGS]
+
+  #
+  def tagword(self, word):
+    tag = self.table.get(word) or self.table.get(word.lower()) or CLOSED_CLASS.get(word.lower())
+    if tag:
+      return tag
+    for pattern, tag in self.rules:
+      if pattern.match(word):
+        return tag
+
+  #
+  def tag(self, tokens):
+    return [(token, self.tagword(token)) for token in tokens]
+
+
+# Writes the lookup table from an NLTK tagged corpus (Penn Treebank by
+# default, matching the NLTK tagger's tagset): each word's most frequent
+# tag, keeping the original case only where it tags differently.
+def buildTagTable(path=DEFAULT_TAG_TABLE, corpus='treebank'):
+  import nltk
+  counts = {}
+  for word, tag in getattr(nltk.corpus, corpus).tagged_words():
+    if tag == '-NONE-':
+      continue
+    for key in set([word, word.lower()]):
+      tags = counts.setdefault(key, {})
+      tags[tag] = tags.get(tag, 0) + 1
+
+  best = dict((word, max(tags, key=tags.get)) for word, tags in counts.items())
+  f = open(path, 'w')
+  try:
+    for word in sorted(best):
+      if word != word.lower() and best.get(word.lower()) == best[word]:
+        continue
+      f.write("%s\t%s\n" % (word.encode('utf-8') if not isinstance(word, str) else word, best[word]))
+  finally:
+    f.close()
+
+
+
+# Backends are created once per process.
+_backends = {}
+
+#
+def getBackend(name='nltk'):
+  backend = _backends.get(name)
+  if backend is None:
+    backend = _backends[name] = {'nltk':NLTKBackend, 'lite':LiteBackend}[name]()
+  return backend
+
+
+# Running this module directly (re)builds the lookup tagger's table.
+if __name__ == '__main__':
+  import sys
+  buildTagTable(*sys.argv[1:3])
@@ -0,0 +1,85 @@
+# N-gram counting benchmark
+# -------------------------
+#
+# Times `--ngram-engine parallel` on a long synthetic text for several
+# worker counts, and checks every run finds exactly the same repeats as
+# the sequential dict counting of `PoemParser.ngramFinder`. Speedups are
+# relative to the parallel engine with one worker, so they show how it
+# scales with cores; the dict counting's time is listed for reference.
+#
+#     python pyParser/bench_ngrams.py --tokens 500000 --jobs 1,2,4,8
+#
+# The text is a dataset's source (`--dataset`) repeated and shuffled by
+# line until it is `--tokens` long, or random words (`--vocabulary` of
+# them, Zipf-distributed) if no dataset is given.
+
+import getopt
+import multiprocessing
+import random
+import sys
+import time
+
+from ngrams import parallelCounts
+
+
+# What `ngramFinder` leaves in `allmatch` for lengths 2 to `maxlen`,
+# restricted to the repeats.
+def sequentialCounts(tokens, maxlen):
+  counts = {}
+  for n in range(2, maxlen+1):
+    for key in zip(*[tokens[i:] for i in range(n)]):
+      counts[key] = counts.get(key, 0) + 1
+  return dict((key, count) for key, count in counts.iteritems() if count > 1)
+
+
+#
+def syntheticTokens(count, vocabulary, dataset=None, basedir="parsed_data"):
+  if dataset:
+    lines = [line.lower().split() for line in open("%s/%s/source/%s" % (basedir, dataset, dataset))]
+    lines = [line for line in lines if line]
+    tokens = []
+    while len(tokens) < count:
+      tokens.extend(random.choice(lines))
+    return tokens[:count]
+  weights = [1.0 / (rank+1) for rank in range(vocabulary)]
+  total = sum(weights)
+  cumulative, acc = [], 0
+  for w in weights:
+    acc += w / total
+    cumulative.append(acc)
+  from bisect import bisect_left
+  return ["w%s" % min(bisect_left(cumulative, random.random()), vocabulary-1) for i in xrange(count)]
+
+
+#
+def timed(func, *args):
+  start = time.time()
+  return func(*args), time.time() - start
+
+
+if __name__ == '__main__':
+  usage = "Usage: python bench_ngrams.py [--tokens N] [--jobs 1,2,4] [--max-ngram 19] [--vocabulary N] [--dataset NAME] [--seed N]"
+  try:
+    opts, _args = getopt.getopt(sys.argv[1:], "", ["tokens=", "jobs=", "max-ngram=", "vocabulary=", "dataset=", "seed="])
+  except getopt.GetoptError, err:
+    print str(err)
+    print usage
+    sys.exit(2)
+  opts = dict(opts)
+  count   = int(opts.get('--tokens', 200000))
+  jobs    = [int(j) for j in opts.get('--jobs', "1,2,4").split(',')]
+  maxlen  = int(opts.get('--max-ngram', 19))
+  random.seed(int(opts.get('--seed', 1)))
+
+  tokens = syntheticTokens(count, int(opts.get('--vocabulary', 5000)), opts.get('--dataset'))
+  print "%s tokens, n-grams of 2 to %s tokens, %s cores" % (len(tokens), maxlen, multiprocessing.cpu_count())
+
+  expected, seconds = timed(sequentialCounts, tokens, maxlen)
+  print "%-12s %5s %9s %8s  %s" % ("engine", "jobs", "seconds", "speedup", "repeats")
+  print "%-12s %5s %9.2f %8s  %s" % ("dict", 1, seconds, "-", len(expected))
+  base = None
+  for j in [1] + [j for j in jobs if j != 1]:
+    found, seconds = timed(parallelCounts, tokens, j, 2, maxlen)
+    base = base or seconds
+    print "%-12s %5s %9.2f %7.2fx  %s%s" % ("parallel", j, seconds, base / seconds, len(found),
+                                           "" if found == expected else "  MISMATCH")
@@ -0,0 +1,112 @@
+# MIDI rendering benchmark
+# ------------------------
+#
+# Times the scalar music algorithms against `--vectorized` on a long
+# synthetic text, for each settings version, and checks they agree: the
+# same notes, and timing, loudness and note-off statistics within a few
+# percent of each other.
+#
+#     python pyParser/bench_render.py --tokens 100000 --settings 12,11,4
+#
+# The text is a dataset's source (`--dataset`) repeated by line until it
+# is `--tokens` long, or random words from `english_words.txt` if no
+# dataset is given. It is analyzed once with the `lite` backend; only the
+# rendering is timed. Every file is rendered at `runAll`'s tempo, and its
+# tempo event is checked.
+
+import getopt
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import parser
+from midirender import readTempo
+from vectorized import decisionArrays, randomState
+
+
+#
+def syntheticText(count, dataset=None, basedir="parsed_data"):
+  if dataset:
+    lines = [line for line in open("%s/%s/source/%s" % (basedir, dataset, dataset)) if line.split()]
+  else:
+    words = [word.strip() for word in open("pyParser/english_words.txt") if word.strip().isalpha()]
+    punctuation = ['', '', '', '', '', ',', '.']
+    lines = [" ".join([random.choice(words) + random.choice(punctuation) for i in range(8)]) + "\n"
+             for j in range(2000)]
+  text, tokens = [], 0
+  while tokens < count:
+    line = random.choice(lines)
+    text.append(line)
+    tokens += len(line.split())
+  return "".join(text)
+
+
+#
+def timed(func, *args):
+  start = time.time()
+  return func(*args), time.time() - start
+
+
+# Mean of each decision field (channel, velocity, delta, off > 0).
+def summary(channel, velocity, delta, off):
+  n = float(max(len(delta), 1))
+  return (sum(velocity) / n, sum(delta) / n, sum(1 for o in off if o) / n)
+
+
+if __name__ == '__main__':
+  usage = "Usage: python bench_render.py [--tokens N] [--settings 12,4] [--dataset NAME] [--seed N]"
+  try:
+    opts, _args = getopt.getopt(sys.argv[1:], "", ["tokens=", "settings=", "dataset=", "seed="])
+  except getopt.GetoptError, err:
+    print str(err)
+    print usage
+    sys.exit(2)
+  opts = dict(opts)
+  count    = int(opts.get('--tokens', 100000))
+  versions = [int(v) for v in opts.get('--settings', "12,11,4").split(',')]
+  random.seed(int(opts.get('--seed', 1)))
+
+  basedir = tempfile.mkdtemp(prefix='bench_render')
+  try:
+    os.makedirs("%s/bench/source" % basedir)
+    f = open("%s/bench/source/bench" % basedir, 'w')
+    f.write(syntheticText(count, opts.get('--dataset')))
+    f.close()
+
+    parser.args['backend'] = 'lite'
+    parser.generate_files  = True
+    pp, seconds = timed(parser.PoemParser, 'bench', basedir)
+    features = pp.features
+    print "%s tokens, analyzed in %.2fs" % (len(features), seconds)
+
+    files = [('%s.mid' % startnote, startnote, absolute) for startnote, absolute in
+             [(70, False), (100, False), (130, False), (30, True), (90, True), (120, True)]]
+
+    print "%-9s %-11s %9s %8s  %s" % ("settings", "engine", "seconds", "speedup", "velocity / delta / off")
+    for version in versions:
+      pp.setMIDISettings(version)
+      decide = pp.getAlgoFunc(pp.settings['algo'])
+
+      pp.lastspeed = 0
+      scalar, base = timed(lambda: zip(*[decide(i, features.count[i]) for i in xrange(len(features))]))
+      arrays, seconds = timed(decisionArrays, features, pp.settings, randomState(1))
+      ref, vec = summary(*scalar), summary(*arrays[:4])
+      name = "v%s/a%s" % (version, pp.settings['algo'])
+      print "%-9s %-11s %9.3f %8s  %.1f / %.1f / %.3f" % (name, "scalar", base, "1.00x", ref[0], ref[1], ref[2])
+      print "%-9s %-11s %9.3f %7.1fx  %.1f / %.1f / %.3f%s" % (name, "vectorized", seconds, base / seconds,
+        vec[0], vec[1], vec[2],
+        "" if all(abs(a - b) <= 0.05 * max(abs(a), 1) for a, b in zip(ref, vec)) else "  MISMATCH")
+
+      # Whole renders of the six `runAll` files.
+      parser.args['vectorized'] = False
+      _, base = timed(pp.renderMIDIFiles, files, parser.SONG_TEMPO)
+      parser.args['vectorized'] = True
+      _, seconds = timed(pp.renderMIDIFiles, files, parser.SONG_TEMPO)
+      tempos = set(readTempo(pp.midiPath(filename)) for filename, _, _ in files)
+      print "%-9s %-11s %9.3f %7.1fx  (six files, scalar %.3fs)%s" % (name, "render", seconds, base / seconds, base,
+        "" if tempos == set([parser.SONG_TEMPO]) else "  TEMPO %s" % sorted(tempos))
+  finally:
+    shutil.rmtree(basedir, True)
@@ -0,0 +1,163 @@
+# N-gram engine check
+# -------------------
+#
+# Runs every `--ngram-engine` on random token lists and checks they find
+# exactly the repeats the dict counting of `PoemParser.ngramFinder` does.
+# The stream engine holds at most 100 counts in memory, so it spills and
+# merges even on these small inputs. `--ngrams closed` and `maximal` are
+# checked against their definitions, and the occurrence positions the
+# suffix and hash engines record against a scan of the tokens.
+#
+#     python pyParser/check_ngrams.py --trials 50 --tokens 2000
+#
+# Each trial draws a token count up to `--tokens`, and either
+# Zipf-distributed words from a vocabulary of 2 to 500 (few or many
+# repeats) or random "verse" - a handful of lines repeated in random
+# order, which gives long repeats - and a longest n-gram of 3, 19 or no
+# limit (19 for verse). Exits with status 1 on any mismatch.
+
+import getopt
+import random
+import sys
+
+from bench_ngrams import syntheticTokens
+from ngrams import RepeatIndex, StreamCounter, hashCounts, parallelCounts, ngramPositions
+
+
+# What `ngramFinder` leaves in `allmatch`, restricted to the repeats; like
+# the engines, it stops at the first length with no repeat.
+def dictCounts(tokens, minlen=2, maxlen=None):
+  ret = {}
+  n = minlen
+  while n <= len(tokens) and (maxlen is None or n <= maxlen):
+    counts = {}
+    for key in zip(*[tokens[i:] for i in range(n)]):
+      counts[key] = counts.get(key, 0) + 1
+    repeats = dict((key, count) for key, count in counts.iteritems() if count > 1)
+    if not repeats:
+      break
+    ret.update(repeats)
+    n += 1
+  return ret
+
+
+# The counts of the repeats one token longer than each repeat:
+# `{ngram: [count, ...]}`.
+def extensions(counts):
+  ret = {}
+  for key, count in counts.iteritems():
+    for shorter in (key[:-1], key[1:]):
+      if shorter in counts:
+        ret.setdefault(shorter, []).append(count)
+  return ret
+
+
+# Closed repeats: no longer repeat contains them with the same count. A
+# longer one would make the one-token extension between them have that
+# count too, so those are the only ones to look at.
+def closedRepeats(counts):
+  longer = extensions(counts)
+  return set(key for key, count in counts.iteritems() if count not in longer.get(key, ()))
+
+
+# Maximal repeats: no longer repeat contains them at all.
+def maximalRepeats(counts):
+  longer = extensions(counts)
+  return set(key for key in counts if key not in longer)
+
+
+# The n-grams `RepeatIndex.select` keeps for `kind`.
+def selected(tokens, kind, maxlen):
+  return set(tuple(tokens[start:start+n]) for start, n in RepeatIndex(tokens).select(kind, 2, maxlen))
+
+
+# The positions an engine records while counting.
+def recordedPositions(counter, tokens, maxlen):
+  positions = {}
+  counter(tokens, maxlen, positions)
+  return positions
+
+
+# A `StreamCounter` that spills every `SPILL` counts, whatever its budget.
+class SpillingCounter(StreamCounter):
+
+  SPILL = 100
+
+  #
+  def maxEntries(self, n):
+    return self.SPILL
+
+
+#
+def verseTokens(count):
+  lines = [["v%s" % random.randint(0, 30) for i in range(random.randint(2, 8))]
+           for j in range(random.randint(2, 6))]
+  tokens = []
+  while len(tokens) < count:
+    tokens.extend(random.choice(lines))
+  return tokens[:count]
+
+
+# Returns `(description, tokens, maxlen)` for one trial.
+def randomTrial(maxTokens):
+  count = random.randint(1, maxTokens)
+  if random.random() < .25:
+    return ("verse", verseTokens(count), 19)
+  vocabulary = random.choice([2, 5, 50, 500])
+  maxlen = random.choice([3, 19, None])
+  return ("%s words" % vocabulary, syntheticTokens(count, vocabulary), maxlen)
+
+
+# `{name: check(tokens, maxlen, counts)}`; each check returns what it
+# found and what it should have found, given the dict counts.
+def checks(jobs):
+  suffix = lambda tokens, maxlen, positions=None: RepeatIndex(tokens).counts(2, maxlen, positions)
+  hash   = lambda tokens, maxlen, positions=None: hashCounts(tokens, 2, maxlen, None, positions)
+  ret = {
+    'suffix':   lambda tokens, maxlen, counts: (suffix(tokens, maxlen), counts),
+    'stream':   lambda tokens, maxlen, counts: (SpillingCounter(1).counts(tokens, 2, maxlen), counts),
+    'parallel': lambda tokens, maxlen, counts: (parallelCounts(tokens, jobs, 2, maxlen), counts),
+    'closed':   lambda tokens, maxlen, counts: (selected(tokens, 'closed', maxlen), closedRepeats(counts)),
+    'maximal':  lambda tokens, maxlen, counts: (selected(tokens, 'maximal', maxlen), maximalRepeats(counts)),
+    'suffix positions': lambda tokens, maxlen, counts: (recordedPositions(suffix, tokens, maxlen),
+                                                        ngramPositions(tokens, counts)),
+  }
+  try:
+    import numpy
+    ret['hash'] = lambda tokens, maxlen, counts: (hash(tokens, maxlen), counts)
+    ret['hash positions'] = lambda tokens, maxlen, counts: (recordedPositions(hash, tokens, maxlen),
+                                                            ngramPositions(tokens, counts))
+  except ImportError:
+    print "NumPy not installed; skipping the hash engine"
+  return ret
+
+
+if __name__ == '__main__':
+  usage = "Usage: python check_ngrams.py [--trials N] [--tokens N] [--jobs N] [--seed N]"
+  try:
+    opts, _args = getopt.getopt(sys.argv[1:], "", ["trials=", "tokens=", "jobs=", "seed="])
+  except getopt.GetoptError, err:
+    print str(err)
+    print usage
+    sys.exit(2)
+  opts = dict(opts)
+  trials    = int(opts.get('--trials', 30))
+  maxTokens = int(opts.get('--tokens', 2000))
+  random.seed(int(opts.get('--seed', 1)))
+
+  tests = checks(int(opts.get('--jobs', 2)))
+  failures = dict((name, 0) for name in tests)
+  for trial in range(trials):
+    description, tokens, maxlen = randomTrial(maxTokens)
+    counts = dictCounts(tokens, 2, maxlen)
+    for name, check in sorted(tests.items()):
+      found, expected = check(tokens, maxlen, counts)
+      if found != expected:
+        failures[name] += 1
+        print "MISMATCH %s: trial %s (%s tokens, %s, max %s): %s repeats, expected %s" % (
+          name, trial, len(tokens), description, maxlen, len(found), len(expected))
+
+  print "%-16s %7s %9s" % ("check", "trials", "failures")
+  for name in sorted(tests):
+    print "%-16s %7s %9s" % (name, trials, failures[name])
+  sys.exit(1 if any(failures.values()) else 0)
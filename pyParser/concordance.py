@@ -0,0 +1,288 @@
+# Concordance index
+# -----------------
+#
+# Keyword-in-context lines for every word of a text from one index built
+# in a single pass, instead of asking `nltk.Text` for each word (which
+# also prints every concordance to stdout along the way).
+#
+# Tokens are mapped to IDs by their lowercased form, as NLTK does, and
+# each ID to the array of offsets it occurs at. The tokens are joined
+# into one string once, with the character offset of every token kept
+# alongside, so the context of an occurrence is a single slice of that
+# string rather than a join of a window of tokens.
+#
+# Every run saves the tokens of the index next to the dataset (as JSON,
+# so serving them never unpickles anything), so concordances can be
+# asked for on demand - from the command line or over HTTP - instead of
+# writing a file per word up front (which `parser.py --concord` still
+# does):
+#
+#     python pyParser/concordance.py --width 60 --lines 5 12days partridge
+#     python pyParser/concordance.py --serve --port 8000
+#     curl 'localhost:8000/concordance?dataset=12days&word=partridge&lines=5'
+
+from array import array
+from collections import OrderedDict
+import json
+import os
+import sys
+import urlparse
+
+from atomicfile import atomicWrite
+
+
+#
+class ConcordanceIndex(object):
+
+  #
+  def __init__(self, tokens):
+    self.tokens  = tokens
+    self.ids     = {}
+    self.offsets = []
+    self.text    = ' '.join(tokens)
+
+    # `starts[i]` is where token `i` starts in `text`; one extra entry
+    # marks where a token after the last one would start.
+    self.starts = array('l')
+    start = 0
+    for i, token in enumerate(tokens):
+      self.starts.append(start)
+      start += len(token) + 1
+      key = token.lower()
+      id = self.ids.get(key)
+      if id is None:
+        id = self.ids[key] = len(self.offsets)
+        self.offsets.append(array('l'))
+      self.offsets[id].append(i)
+    self.starts.append(start)
+
+
+  # Offsets of every occurrence of `word`, in any case.
+  def offsetsOf(self, word):
+    id = self.ids.get(word.lower())
+    if id is None:
+      return array('l')
+    return self.offsets[id]
+
+
+  # The tokens `[start, end)` joined by spaces, sliced out of `text`.
+  def span(self, start, end):
+    start = max(start, 0)
+    end   = min(end, len(self.tokens))
+    if start >= end:
+      return ''
+    return self.text[self.starts[start]:self.starts[end]-1]
+
+
+  # Up to `lines` concordance lines for `word`, `width` characters wide
+  # with the word in the middle: the format `PoemParser.get_concordance`
+  # always had.
+  def lines(self, word, width=75, lines=25):
+    half_width = (width - len(word) - 2) / 2
+    # Approximate number of words of context.
+    context = width/4
+    ret = []
+    for i in self.offsetsOf(word)[:lines]:
+      left  = (' ' * half_width + self.span(i-context, i))[-half_width:]
+      right = self.span(i+1, i+context)[:half_width]
+      ret.append("%s  %s  %s\n" % (left, word, right))
+    return ''.join(ret)
+
+
+  # Saves the tokens atomically, for `loadConcordance` to rebuild the
+  # index from.
+  def save(self, path):
+    tokens = [token.decode('utf-8', 'replace') if isinstance(token, str) else token
+              for token in self.tokens]
+    atomicWrite(path, lambda f: json.dump({'version':VERSION, 'tokens':tokens}, f))
+
+
+
+# The format `save` writes.
+VERSION = 1
+
+#
+def loadConcordance(path):
+  f = open(path, 'rb')
+  try:
+    data = json.load(f)
+  finally:
+    f.close()
+  if data.get('version') != VERSION:
+    raise ValueError("concordance:%s is not a version %s index" % (path, VERSION))
+  return ConcordanceIndex(data['tokens'])
+
+
+# Where a dataset's concordance index is saved.
+def concordancePath(basedir, dataset):
+  return "%s/%s/.index/concordance.json" % (basedir, dataset)
+
+
+# Is `dataset` the plain name of a dataset directory under `basedir`?
+# Anything that could point elsewhere (`..`, a path separator) is not.
+def isDataset(basedir, dataset):
+  if not dataset or dataset.startswith('.') or '/' in dataset or '\\' in dataset:
+    return False
+  return os.path.isdir(os.path.join(basedir, dataset))
+
+
+
+# Query service
+# -------------
+
+# A dict that holds at most `size` entries, dropping the least recently
+# used one to make room.
+class LRUCache(object):
+
+  #
+  def __init__(self, size=1024):
+    self.size    = size
+    self.entries = OrderedDict()
+    self.hits    = 0
+    self.misses  = 0
+
+  #
+  def get(self, key):
+    try:
+      value = self.entries.pop(key)
+    except KeyError:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self.entries[key] = value
+    return value
+
+  #
+  def put(self, key, value):
+    self.entries.pop(key, None)
+    self.entries[key] = value
+    if len(self.entries) > self.size:
+      self.entries.popitem(False)
+
+
+
+# Answers concordance queries for the datasets under `basedir`, from their
+# saved indexes (reloaded whenever a run replaces one) and a cache of
+# recent answers. Widths and line counts are bounded, so a query can't
+# ask for arbitrarily large answers.
+class ConcordanceService(object):
+
+  MAX_WIDTH = 1000
+  MAX_LINES = 1000
+
+  #
+  def __init__(self, basedir="parsed_data", cachesize=1024):
+    self.basedir = basedir
+    self.indexes = {}
+    self.cache   = LRUCache(cachesize)
+
+
+  # The saved index of `dataset`, or None if it has none. Raises
+  # ValueError for names that aren't a dataset under `basedir`.
+  def index(self, dataset):
+    if not isDataset(self.basedir, dataset):
+      raise ValueError("no dataset named %r" % dataset)
+    path = concordancePath(self.basedir, dataset)
+    try:
+      mtime = os.stat(path).st_mtime
+    except OSError:
+      return None
+    loaded = self.indexes.get(dataset)
+    if loaded is None or loaded[0] != mtime:
+      loaded = self.indexes[dataset] = (mtime, loadConcordance(path))
+      self.cache = LRUCache(self.cache.size)
+    return loaded[1]
+
+
+  # Concordance lines for `word` in `dataset` (UTF-8 encoded), or None if
+  # the dataset has no saved index. Raises ValueError for unknown datasets
+  # and for a `width` or `lines` out of bounds.
+  def query(self, dataset, word, width=75, lines=25):
+    if not 0 < width <= self.MAX_WIDTH:
+      raise ValueError("width must be between 1 and %s" % self.MAX_WIDTH)
+    if not 0 < lines <= self.MAX_LINES:
+      raise ValueError("lines must be between 1 and %s" % self.MAX_LINES)
+    if isinstance(word, str):
+      word = word.decode('utf-8', 'replace')
+    index = self.index(dataset)
+    if index is None:
+      return None
+    key = (dataset, word, width, lines)
+    ret = self.cache.get(key)
+    if ret is None:
+      ret = index.lines(word, width, lines).encode('utf-8')
+      self.cache.put(key, ret)
+    return ret
+
+
+
+# Serves `GET /concordance?dataset=..&word=..[&width=75][&lines=25]` as
+# plain text until interrupted.
+def serve(service, port=8000, host='localhost'):
+  import BaseHTTPServer
+
+  class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+      url = urlparse.urlparse(self.path)
+      params = dict((k, v[-1]) for k, v in urlparse.parse_qs(url.query).items())
+      if url.path != '/concordance' or 'dataset' not in params or 'word' not in params:
+        return self.reply(400, "usage: /concordance?dataset=NAME&word=WORD[&width=75][&lines=25]\n")
+      try:
+        width, lines = int(params.get('width', 75)), int(params.get('lines', 25))
+      except ValueError:
+        return self.reply(400, "width and lines must be numbers\n")
+      try:
+        ret = service.query(params['dataset'], params['word'], width, lines)
+      except ValueError, err:
+        return self.reply(400, "%s\n" % err)
+      if ret is None:
+        return self.reply(404, "no concordance index for %s\n" % params['dataset'])
+      self.reply(200, ret)
+
+    def reply(self, status, body):
+      self.send_response(status)
+      self.send_header('Content-Type', 'text/plain; charset=utf-8')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+  server = BaseHTTPServer.HTTPServer((host, port), Handler)
+  print "concordance: serving %s on http://%s:%s/concordance" % (service.basedir, host, port)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  server.server_close()
+
+
+
+if __name__ == '__main__':
+  import getopt
+  usage = """Usage: python concordance.py [--basedir parsed_data] [--width 75] [--lines 25] DATASET WORD ...
+       python concordance.py [--basedir parsed_data] --serve [--port 8000]"""
+  try:
+    opts, argv = getopt.getopt(sys.argv[1:], "", ["basedir=", "width=", "lines=", "serve", "port="])
+  except getopt.GetoptError, err:
+    print str(err)
+    print usage
+    sys.exit(2)
+  opts = dict(opts)
+  service = ConcordanceService(opts.get('--basedir', "parsed_data"))
+
+  if '--serve' in opts:
+    serve(service, int(opts.get('--port', 8000)))
+  elif len(argv) >= 2:
+    for word in argv[1:]:
+      try:
+        ret = service.query(argv[0], word, int(opts.get('--width', 75)), int(opts.get('--lines', 25)))
+      except ValueError, err:
+        print str(err)
+        sys.exit(2)
+      if ret is None:
+        print "No concordance index for %s; run parser.py --dataset %s first." % (argv[0], argv[0])
+        sys.exit(1)
+      sys.stdout.write(ret)
+  else:
+    print usage
+    sys.exit(2)
@@ -0,0 +1,201 @@
+# Corpus index
+# ------------
+#
+# An inverted index over every dataset under `parsed_data`, so questions
+# like "which poems use this word" or "which poems share this phrase"
+# are a lookup rather than a re-analysis of every dataset.
+#
+# It's a `shelve` with one record per lowercased word, mapping each
+# dataset that uses it to the word's positions there (`wordindex`
+# values, as in the dataset's JSON). Global frequencies are summed from
+# the same records, and phrases are found by intersecting the positions
+# of their words. Each dataset also has a record with the signature of
+# the source it was indexed from, so `parser.py --index` only re-indexes
+# datasets whose source changed.
+#
+#     python pyParser/corpusindex.py word christmas
+#     python pyParser/corpusindex.py phrase "my true love"
+
+import hashlib
+import os
+import shelve
+import sys
+import time
+
+
+#
+class CorpusIndex(object):
+
+  #
+  def __init__(self, path, flag='c'):
+    self.path = path
+    dir = os.path.dirname(path)
+    if flag != 'r' and dir and not os.path.exists(dir):
+      os.makedirs(dir)
+    self.db = shelve.open(path, flag, 2)
+
+
+  #
+  def close(self):
+    self.db.close()
+
+
+  # `shelve` keys must be byte strings.
+  def key(self, kind, name):
+    if not isinstance(name, str):
+      name = name.encode('utf-8')
+    return "%s:%s" % (kind, name)
+
+
+  # Names of the indexed datasets, with their token counts.
+  def datasets(self):
+    return self.db.get('datasets', {})
+
+
+  # Is `dataset` indexed from a source with this signature?
+  def isCurrent(self, dataset, signature):
+    record = self.db.get(self.key('d', dataset))
+    return record is not None and record['signature'] == signature
+
+
+  # (Re)indexes `dataset` from its lowered `tokens`.
+  def add(self, dataset, signature, tokens):
+    self.remove(dataset)
+    positions = {}
+    for i, word in enumerate(tokens):
+      positions.setdefault(word, []).append(i+1)
+    for word, offsets in positions.iteritems():
+      key = self.key('w', word)
+      record = self.db.get(key, {})
+      record[dataset] = offsets
+      self.db[key] = record
+    self.db[self.key('d', dataset)] = {'signature':signature, 'words':sorted(positions)}
+    datasets = self.datasets()
+    datasets[dataset] = len(tokens)
+    self.db['datasets'] = datasets
+
+
+  #
+  def remove(self, dataset):
+    record = self.db.get(self.key('d', dataset))
+    if record is None:
+      return
+    for word in record['words']:
+      key = self.key('w', word)
+      postings = self.db[key]
+      del postings[dataset]
+      if postings:
+        self.db[key] = postings
+      else:
+        del self.db[key]
+    del self.db[self.key('d', dataset)]
+    datasets = self.datasets()
+    datasets.pop(dataset, None)
+    self.db['datasets'] = datasets
+
+
+  # Returns `{dataset: [wordindex, ...]}` for `word`.
+  def postings(self, word):
+    return self.db.get(self.key('w', word.lower()), {})
+
+
+  # How often `word` occurs across all datasets.
+  def frequency(self, word):
+    return sum(len(offsets) for offsets in self.postings(word).itervalues())
+
+
+  # Returns `{dataset: [wordindex, ...]}` of where the phrase `words`
+  # starts: the positions of the first word for which every following
+  # word is at the next position.
+  def phrase(self, words):
+    words = [word.lower() for word in words]
+    if not words:
+      return {}
+    ret = {}
+    for dataset, starts in self.postings(words[0]).iteritems():
+      starts = set(starts)
+      for k, word in enumerate(words[1:], 1):
+        offsets = self.postings(word).get(dataset)
+        if not offsets:
+          starts = None
+          break
+        starts.intersection_update(offset - k for offset in offsets)
+        if not starts:
+          break
+      if starts:
+        ret[dataset] = sorted(starts)
+    return ret
+
+
+
+# The source signature a dataset is indexed under.
+def sourceSignature(filename):
+  f = open(filename, 'rb')
+  try:
+    return hashlib.sha1(f.read()).hexdigest()
+  finally:
+    f.close()
+
+
+#
+def indexPath(basedir):
+  return "%s/.index/corpus" % basedir
+
+
+# Brings the index under `basedir` up to date with `datasets`; `tokens`
+# returns the lowered tokens of a dataset and is only called for
+# datasets whose source changed. Returns the names re-indexed.
+def updateCorpusIndex(basedir, datasets, tokens):
+  index = CorpusIndex(indexPath(basedir))
+  updated = []
+  try:
+    for dataset in datasets:
+      signature = sourceSignature("%s/%s/source/%s" % (basedir, dataset, dataset))
+      if not index.isCurrent(dataset, signature):
+        index.add(dataset, signature, tokens(dataset))
+        updated.append(dataset)
+  finally:
+    index.close()
+  return updated
+
+
+
+# Query command line.
+if __name__ == '__main__':
+  import getopt
+  usage = """Usage: python corpusindex.py [--basedir parsed_data] word WORD ... | phrase WORDS ... | datasets"""
+  try:
+    opts, argv = getopt.getopt(sys.argv[1:], "", ["basedir="])
+  except getopt.GetoptError, err:
+    print str(err)
+    print usage
+    sys.exit(2)
+  basedir = dict(opts).get('--basedir', "parsed_data")
+  if not argv or argv[0] not in ('word', 'phrase', 'datasets'):
+    print usage
+    sys.exit(2)
+
+  try:
+    index = CorpusIndex(indexPath(basedir), 'r')
+  except Exception:
+    print "No corpus index under %s; run parser.py --index --all first." % basedir
+    sys.exit(1)
+  command, words = argv[0], " ".join(argv[1:]).split()
+  start = time.time()
+  if command == 'datasets':
+    for name, count in sorted(index.datasets().items()):
+      print "%s\t%s tokens" % (name, count)
+  elif command == 'word':
+    for word in words:
+      postings = index.postings(word)
+      print "%s: %s occurrences in %s datasets" % (word, index.frequency(word), len(postings))
+      for dataset, offsets in sorted(postings.items()):
+        print "  %s\t%s" % (dataset, " ".join(str(offset) for offset in offsets))
+  else:
+    found = index.phrase(words)
+    print "%s: %s occurrences in %s datasets" % (" ".join(words),
+      sum(len(starts) for starts in found.itervalues()), len(found))
+    for dataset, starts in sorted(found.items()):
+      print "  %s\t%s" % (dataset, " ".join(str(start) for start in starts))
+  print "(%.3f ms)" % ((time.time() - start) * 1000)
+  index.close()
@@ -0,0 +1,120 @@
+# Token feature table
+# -------------------
+#
+# Every per-token fact the music algorithms and the JSON writer need,
+# computed once per dataset and stored column-wise (one list per feature,
+# indexed by token position). Renders read a column entry instead of
+# redoing cmudict lookups, punctuation scans and first-occurrence
+# bookkeeping for every token of every variant.
+#
+# Phonetic features (syllables, stress, primary stress) are looked up
+# once per distinct word and packed into arrays indexed by word ID; a
+# token reaches them through its `wordId`.
+
+from array import array
+
+
+# Stress patterns are packed 2 bits per syllable, first syllable in the
+# lowest bits; longer words keep the stress of their first 16 syllables.
+MAXSTRESS = 16
+
+
+# Packs a stress string (`'102'`) into an integer.
+def packStress(stress):
+  ret = 0
+  for i, mark in enumerate(stress[:MAXSTRESS]):
+    ret |= int(mark) << (2*i)
+  return ret
+
+
+# Unpacks `syllables` stress marks from `bits` into a string.
+def unpackStress(bits, syllables):
+  return ''.join(["%s" % ((bits >> (2*i)) & 3) for i in range(min(syllables, MAXSTRESS))])
+
+
+
+#
+class TokenFeatures(object):
+
+  # `phonetics` returns `(syllables, stress, primary)` for a word, as
+  # `LexiconIndex.phonetics` does. `postagger` is called with no arguments
+  # the first time the `pos` column is needed, so tables built for
+  # MIDI-only runs never load the tagger.
+  def __init__(self, tokens, replacedTokens, fullTokens, phonetics, postagger=None):
+    self.token     = list(tokens)
+    self.rtoken    = list(replacedTokens)
+    self.fulltoken = list(fullTokens)
+    self._postagger = postagger
+    self._pos       = None
+
+    # Per distinct word, by word ID:
+    # `syllables` - syllables of the first pronunciation (0 if unknown).
+    # `stressBits` - its stress marks, packed by `packStress`.
+    # `primary` - the 0-based syllable with primary stress, or -1.
+    self.words      = []
+    self.syllables  = array('B')
+    self.stressBits = array('L')
+    self.primary    = array('b')
+
+    # `wordId` - the token's word ID.
+    # `numsyl` - syllables of the first pronunciation (0 if unknown).
+    # `sentenceEnd` / `sentencePause` - does the *previous* full word
+    # carry a period / comma?
+    # `firstIndex` - position+1 of the word's first occurrence.
+    # `firstOrder` - 1-based rank of the word among distinct words.
+    # `count` - running number of occurrences, including this one.
+    self.wordId        = array('l')
+    self.numsyl        = []
+    self.sentenceEnd   = []
+    self.sentencePause = []
+    self.firstIndex    = []
+    self.firstOrder    = []
+    self.count         = []
+
+    seen      = {}
+    counts    = {}
+    lastfullword = ''
+    for i, word in enumerate(self.token):
+      if word not in seen:
+        seen[word] = (i+1, len(seen)+1, len(self.words))
+        syllables, stress, primary = phonetics(word)
+        self.words.append(word)
+        self.syllables.append(min(syllables, 255))
+        self.stressBits.append(packStress(stress))
+        self.primary.append(min(primary, 127))
+      counts[word] = counts.get(word, 0) + 1
+
+      id = seen[word][2]
+      self.wordId.append(id)
+      self.numsyl.append(self.syllables[id])
+      self.sentenceEnd.append('.' in lastfullword)
+      self.sentencePause.append(',' in lastfullword)
+      self.firstIndex.append(seen[word][0])
+      self.firstOrder.append(seen[word][1])
+      self.count.append(counts[word])
+
+      if i < len(self.fulltoken):
+        lastfullword = self.fulltoken[i]
+      else:
+        lastfullword = ''
+
+  #
+  def __len__(self):
+    return len(self.token)
+
+  # Stress marks of the token at `index` (`'102'`; `''` if unknown).
+  def stress(self, index):
+    id = self.wordId[index]
+    return unpackStress(self.stressBits[id], self.syllables[id])
+
+  # The 0-based syllable of the token at `index` with primary stress, or
+  # -1 if it has none (unknown words, most function words).
+  def primaryStress(self, index):
+    return self.primary[self.wordId[index]]
+
+  # Part-of-speech tag per token, filled in on first use.
+  @property
+  def pos(self):
+    if self._pos is None:
+      self._pos = [pos for (word, pos) in self._postagger()]
+    return self._pos
@@ -0,0 +1,138 @@
+# Incremental analysis state
+# --------------------------
+#
+# What a `--incremental` run remembers about a dataset between runs: a
+# content hash per source line, the cleaned tokens of each line, the
+# token stream, the n-gram counts and a signature of the inputs of every
+# output file. On the next run the source is diffed line by line against
+# the previous one, so only changed lines are re-tokenized, the n-gram
+# counts are patched by delta, only concordances near an edit are
+# rewritten and outputs whose inputs didn't change are left alone.
+# (Re-tagging is already limited to changed lines by the tag cache.)
+
+import difflib
+import hashlib
+import os
+from bisect import bisect_left
+
+from atomicfile import savePickle, loadPickle
+
+
+VERSION = 3
+
+
+#
+def lineHash(line):
+  if not isinstance(line, bytes):
+    line = line.encode('utf-8')
+  return hashlib.sha1(line).hexdigest()
+
+
+# Returns the token index each line starts at; `lines` holds the line
+# number of every token, in order, and the result has `nlines+1` entries.
+def lineStarts(lines, nlines):
+  return [bisect_left(lines, k) for k in range(nlines+1)]
+
+
+#
+class AnalysisState(object):
+
+  #
+  def __init__(self, path):
+    self.path       = path
+    self.previous   = None
+    self.lineTokens = {}
+    self.outputs    = {}
+
+    data = loadPickle(path, {})
+    if data.get('version') != VERSION:
+      return
+
+    self.previous   = data
+    self.lineTokens = data['lineTokens']
+    self.outputs    = data['outputs']
+
+
+  # Returns the changed regions between the previous and the current
+  # token stream, as `((oldstart, oldend), (newstart, newend))` token
+  # ranges, or None when there is no previous run to compare against.
+  def changes(self, lineHashes, tokenLines):
+    if self.previous is None:
+      return None
+
+    old = self.previous
+    oldStarts = lineStarts(old['tokenLines'], len(old['lineHashes']))
+    newStarts = lineStarts(tokenLines, len(lineHashes))
+
+    matcher = difflib.SequenceMatcher(None, old['lineHashes'], lineHashes, False)
+    ret = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+      if tag != 'equal':
+        ret.append(((oldStarts[i1], oldStarts[i2]), (newStarts[j1], newStarts[j2])))
+    return ret
+
+
+  # Has the output at `path` been written from exactly these inputs
+  # before? If not, its new signature is remembered for the next run.
+  def isCurrent(self, path, signature):
+    if self.outputs.get(path) == signature and os.path.exists(path):
+      return True
+    self.outputs[path] = signature
+    return False
+
+
+  # `ngramKey` identifies how `allmatch` was counted; counts are only
+  # patched by delta when the next run counts the same way.
+  def save(self, lineHashes, tokenLines, tokens, loweredTokens, allmatch, ngramKey):
+    current = set(lineHashes)
+    data = {
+      'version':       VERSION,
+      'lineHashes':    lineHashes,
+      'tokenLines':    tokenLines,
+      'tokens':        tokens,
+      'loweredTokens': loweredTokens,
+      'allmatch':      allmatch,
+      'ngramKey':      ngramKey,
+      'lineTokens':    dict((k, v) for k, v in self.lineTokens.items() if k in current),
+      'outputs':       self.outputs,
+    }
+    savePickle(self.path, data)
+
+
+
+# Window starts of all `n`-grams in a stream of `length` tokens that
+# overlap one of the token ranges in `regions` (an empty range marks an
+# insertion/deletion point; windows straddling it are included).
+def affectedWindows(regions, n, length):
+  ret = set()
+  for start, end in regions:
+    ret.update(xrange(max(0, start-n+1), min(end, length-n+1)))
+  return ret
+
+
+# Patches n-gram counts in `allmatch`, taken from `old`, so they match
+# `new`: windows touching a changed region are subtracted from the old
+# stream and added back from the new one, everything else is untouched.
+def updateNgramCounts(allmatch, old, new, changes, ngramRange):
+  oldRegions = [o for o, n in changes]
+  newRegions = [n for o, n in changes]
+  for n in ngramRange:
+    for i in affectedWindows(oldRegions, n, len(old)):
+      key = tuple(old[i:i+n])
+      allmatch[key] -= 1
+      if not allmatch[key]:
+        del allmatch[key]
+    for i in affectedWindows(newRegions, n, len(new)):
+      key = tuple(new[i:i+n])
+      allmatch[key] = allmatch.get(key, 0) + 1
+  return allmatch
+
+
+# Returns the lowercased words whose concordance lines can have changed:
+# every word within `context` tokens of an edit, in the old or new text.
+def affectedWords(old, new, changes, context):
+  ret = set()
+  for (a1, a2), (b1, b2) in changes:
+    ret.update(w.lower() for w in old[max(0, a1-context):a2+context])
+    ret.update(w.lower() for w in new[max(0, b1-context):b2+context])
+  return ret
@@ -0,0 +1,324 @@
+# Lexicon index
+# -------------
+#
+# A build-once, on-disk index over `english_words.txt` and the NLTK
+# CMU pronouncing dictionary. `PoemParser` used to re-read the word list
+# into a fresh set and parse all of `cmudict` on every start; instead, the
+# index is written once as a sorted string table plus packed phoneme
+# records and queried through `mmap`, so startup is a few `stat` calls and
+# the pages are shared between concurrent processes via the page cache.
+#
+# Each word also carries the rhyme key of its first pronunciation (its
+# phonemes from the last stressed vowel on, see `rhymeKey`), so rhyme
+# groups for a poem are a lookup per vocabulary word rather than a scan
+# of the whole dictionary.
+#
+# The index is rebuilt automatically whenever the size or mtime of the
+# word list or of the cmudict corpus file it was built from changes.
+#
+# Layout (all integers little-endian):
+#
+# `header   : magic, version, nkeys, then section offsets`
+#
+# `sources  : the signature of the files the index was built from`
+#
+# `phones   : newline separated phoneme symbols, index == phoneme code`
+#
+# `entries  : (nkeys+1) x (key offset, pron offset, npron, flags, rhyme)`
+#
+# `keys     : the sorted, lowercased, utf-8 encoded words`
+#
+# `prons    : per pronunciation, a length byte followed by phoneme codes`
+#
+# `rhymes   : newline separated rhyme keys, index == rhyme code (0 is none)`
+
+import mmap
+import os
+import struct
+
+from atomicfile import atomicWrite
+
+
+MAGIC   = 'PPLEXIDX'.encode('ascii')
+VERSION = 2
+
+HEADER  = struct.Struct('<8sIIIIIIII')
+ENTRY   = struct.Struct('<IIBBI')
+
+# `flags` bits.
+ENGLISH = 1
+
+DEFAULT_WORDS = "pyParser/english_words.txt"
+DEFAULT_INDEX = "pyParser/lexicon.idx"
+
+
+#
+class LexiconIndex(object):
+
+  #
+  def __init__(self, path):
+    self.path = path
+    f = open(path, 'rb')
+    try:
+      self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+      f.close()
+
+    (magic, version, self.nkeys, sources, phones,
+     self.entries, self.keys, self.prons, self.rhymes) = HEADER.unpack_from(self.mm, 0)
+    if magic != MAGIC or version != VERSION:
+      raise ValueError("lexicon:%s is not a version %s index" % (path, VERSION))
+
+    self.sources = readSources(self.mm, sources)
+    self.phones  = self.mm[phones:self.entries].decode('ascii').split('\n')
+    self.vowels  = [phone[-1:].isdigit() for phone in self.phones]
+    self._rhymeKeys = None
+
+  #
+  def close(self):
+    self.mm.close()
+
+
+  # Returns True if none of the files this index was built from has changed.
+  def isCurrent(self):
+    for path, size, mtime in self.sources:
+      if sourceSignature(path) != (path, size, mtime):
+        return False
+    return True
+
+
+  # Binary search of the sorted key table; returns the entry number or -1.
+  def find(self, word):
+    if not isinstance(word, bytes):
+      word = word.encode('utf-8')
+    word = word.lower()
+
+    mm, keys = self.mm, self.keys
+    lo, hi = 0, self.nkeys
+    while lo < hi:
+      mid = (lo + hi) // 2
+      start = ENTRY.unpack_from(mm, self.entries + mid*ENTRY.size)[0]
+      end   = ENTRY.unpack_from(mm, self.entries + (mid+1)*ENTRY.size)[0]
+      key   = mm[keys+start:keys+end]
+      if key < word:
+        lo = mid + 1
+      elif key > word:
+        hi = mid
+      else:
+        return mid
+    return -1
+
+
+  # Returns the packed phoneme codes of every pronunciation of entry `n`.
+  def pronCodes(self, n):
+    _, offset, npron, _, _ = ENTRY.unpack_from(self.mm, self.entries + n*ENTRY.size)
+    mm = self.mm
+    pos = self.prons + offset
+    ret = []
+    for _ in range(npron):
+      length = bytearray(mm[pos:pos+1])[0]
+      ret.append(bytearray(mm[pos+1:pos+1+length]))
+      pos += 1 + length
+    return ret
+
+
+  #
+  def __contains__(self, word):
+    return self.find(word) != -1
+
+
+  # Is `word` part of the english word list?
+  def isEnglish(self, word):
+    n = self.find(word)
+    if n == -1:
+      return False
+    return bool(ENTRY.unpack_from(self.mm, self.entries + n*ENTRY.size)[3] & ENGLISH)
+
+
+  # Returns the CMU pronunciations of `word` as lists of phoneme symbols,
+  # or an empty list if the word is unknown.
+  def pronunciations(self, word):
+    n = self.find(word)
+    if n == -1:
+      return []
+    return [[self.phones[c] for c in codes] for codes in self.pronCodes(n)]
+
+
+  # Returns the number of syllables of every pronunciation of `word`
+  # (`[0]` if it has none), as `PoemParser.numsyl` always has.
+  def numsyl(self, word):
+    n = self.find(word)
+    if n == -1:
+      return [0]
+    vowels = self.vowels
+    ret = [sum(1 for c in codes if vowels[c]) for codes in self.pronCodes(n)]
+    return ret or [0]
+
+
+  # Returns `(syllables, stress, primary)` for the first pronunciation of
+  # `word`: its syllable count, its stress marks as a string (`'102'` for
+  # "yesterday") and the 0-based syllable carrying primary stress, or -1.
+  # Unknown words are `(0, '', -1)`.
+  def phonetics(self, word):
+    n = self.find(word)
+    if n == -1:
+      return (0, '', -1)
+    prons = self.pronCodes(n)
+    if not prons:
+      return (0, '', -1)
+    phones = self.phones
+    stress = str(''.join(phones[c][-1] for c in prons[0] if self.vowels[c]))
+    return (len(stress), stress, stress.find('1'))
+
+
+  # Returns the rhyme code of `word`'s first pronunciation; words rhyme
+  # if their codes are equal. 0 if the word is unknown or has no vowel.
+  def rhymeCode(self, word):
+    n = self.find(word)
+    if n == -1:
+      return 0
+    return ENTRY.unpack_from(self.mm, self.entries + n*ENTRY.size)[4]
+
+
+  # Returns the rhyme key with code `code` (e.g. `'EY T'`); the key table
+  # is only decoded the first time it's needed.
+  def rhymeName(self, code):
+    if self._rhymeKeys is None:
+      self._rhymeKeys = self.mm[self.rhymes:].decode('ascii').split('\n')
+    return self._rhymeKeys[code]
+
+
+
+# Index building
+# --------------
+
+# Returns `(path, size, mtime)` for a source file, or `(path, -1, -1)` if
+# it no longer exists.
+def sourceSignature(path):
+  try:
+    st = os.stat(path)
+  except OSError:
+    return (path, -1, -1)
+  return (path, st.st_size, int(st.st_mtime))
+
+
+#
+def readSources(mm, offset):
+  (length,) = struct.unpack_from('<I', mm, offset)
+  ret = []
+  for line in mm[offset+4:offset+4+length].decode('utf-8').splitlines():
+    path, size, mtime = line.rsplit('\t', 2)
+    ret.append((path, int(size), int(mtime)))
+  return ret
+
+
+# Returns the rhyme key of a pronunciation: its phonemes from the last
+# stressed vowel (primary or secondary stress; the last vowel if none is
+# stressed) to the end, with stress marks dropped, so that "late" and
+# "create" share `'EY T'`. None if the pronunciation has no vowel.
+def rhymeKey(phones):
+  vowels = [i for i, phone in enumerate(phones) if phone[-1:].isdigit()]
+  if not vowels:
+    return None
+  stressed = [i for i in vowels if phones[i][-1] in '12']
+  start = (stressed or vowels)[-1]
+  return ' '.join(phone.rstrip('012') for phone in phones[start:])
+
+
+# Locates the cmudict corpus file used by `nltk.corpus.cmudict`.
+def findCMUDict():
+  import nltk
+  return nltk.data.find('corpora/cmudict/cmudict')
+
+
+# Writes a fresh index to `path` from the word list and cmudict. The file
+# is written under a temporary name and renamed into place, so concurrent
+# readers never see a half-written index.
+def buildLexicon(path=DEFAULT_INDEX, wordsfile=DEFAULT_WORDS):
+  from nltk.corpus import cmudict
+
+  english = set()
+  with open(wordsfile) as word_file:
+    for word in word_file:
+      word = word.strip().lower()
+      if word:
+        english.add(word)
+
+  prons = {}
+  for word, phones in cmudict.entries():
+    prons.setdefault(word.lower(), []).append(phones)
+
+  cmupath = "%s" % findCMUDict()
+  sources = [sourceSignature(wordsfile), sourceSignature(cmupath)]
+
+  phonecodes = {}
+  rhymecodes = {None:0}
+  keys = {}
+  for word in english.union(prons):
+    keys[word.encode('utf-8') if not isinstance(word, bytes) else word] = word
+
+  keyblob  = bytearray()
+  pronblob = bytearray()
+  entries  = bytearray()
+  for key in sorted(keys):
+    word = keys[key]
+    wordprons = prons.get(word, [])[:255]
+    rhyme = rhymeKey(wordprons[0]) if wordprons else None
+    entries += ENTRY.pack(len(keyblob), len(pronblob), len(wordprons),
+                          ENGLISH if word in english else 0,
+                          rhymecodes.setdefault(rhyme, len(rhymecodes)))
+    keyblob += key
+    for phones in wordprons:
+      pronblob.append(len(phones))
+      for phone in phones:
+        pronblob.append(phonecodes.setdefault(str(phone), len(phonecodes)))
+  entries += ENTRY.pack(len(keyblob), len(pronblob), 0, 0, 0)
+
+  sourceblob = '\n'.join('%s\t%s\t%s' % s for s in sources).encode('utf-8')
+  sourceblob = struct.pack('<I', len(sourceblob)) + sourceblob
+  phoneblob  = '\n'.join(sorted(phonecodes, key=phonecodes.get)).encode('ascii')
+  rhymeblob  = '\n'.join(['']+sorted(rhymecodes, key=rhymecodes.get)[1:]).encode('ascii')
+
+  offset = HEADER.size
+  sections = []
+  for blob in (sourceblob, phoneblob, entries, keyblob, pronblob, rhymeblob):
+    sections.append(offset)
+    offset += len(blob)
+
+  def write(f):
+    f.write(HEADER.pack(MAGIC, VERSION, len(keys), *sections))
+    for blob in (sourceblob, phoneblob, entries, keyblob, pronblob, rhymeblob):
+      f.write(bytes(blob))
+  atomicWrite(path, write)
+
+
+# Lexicons are opened once per process and shared by every `PoemParser`.
+_lexicons = {}
+
+# Returns the mapped lexicon index at `path`, (re)building it first if it
+# is missing, unreadable or out of date with respect to its sources.
+def openLexicon(path=DEFAULT_INDEX, wordsfile=DEFAULT_WORDS):
+  lexicon = _lexicons.get(path)
+  if lexicon is not None:
+    return lexicon
+
+  try:
+    lexicon = LexiconIndex(path)
+    if not lexicon.isCurrent() or lexicon.sources[0][0] != wordsfile:
+      lexicon.close()
+      lexicon = None
+  except (IOError, OSError, ValueError, struct.error):
+    lexicon = None
+
+  if lexicon is None:
+    buildLexicon(path, wordsfile)
+    lexicon = LexiconIndex(path)
+
+  _lexicons[path] = lexicon
+  return lexicon
+
+
+# Running this module directly (re)builds the index.
+if __name__ == '__main__':
+  import sys
+  buildLexicon(*sys.argv[1:3])
@@ -0,0 +1,135 @@
+# Markov text generator
+# ---------------------
+#
+# Pseudo-text "in the style of" a dataset from a trigram model of its
+# tokens. NLTK's `Text.generate` rebuilt its language model on every call
+# and printed a single unseeded sample; this model is compiled once per
+# dataset, saved next to its outputs and reused until the tokens change.
+#
+# The model maps each pair of consecutive token IDs to the tokens seen
+# after it, with an alias table (Vose's method) per pair, so drawing the
+# next token costs two random numbers however many successors there are.
+
+from array import array
+import hashlib
+import random
+import textwrap
+
+from atomicfile import savePickle, loadPickle
+from ngrams import internTokens
+
+
+VERSION = 1
+
+
+# Returns a signature of `tokens`; a saved model is reused only for the
+# exact tokens it was built from.
+def tokenSignature(tokens):
+  data = '\n'.join(tokens)
+  if not isinstance(data, bytes):
+    data = data.encode('utf-8')
+  return hashlib.sha1(data).hexdigest()
+
+
+# Builds an alias table for drawing index `i` with probability
+# `weights[i] / sum(weights)`; returns `(probability, alias)` arrays.
+def aliasTable(weights):
+  n = len(weights)
+  total = float(sum(weights))
+  scaled = [w * n / total for w in weights]
+  probability = array('d', [1.0] * n)
+  alias = array('l', range(n))
+  small = [i for i, p in enumerate(scaled) if p < 1.0]
+  large = [i for i, p in enumerate(scaled) if p >= 1.0]
+  while small and large:
+    s, l = small.pop(), large.pop()
+    probability[s] = scaled[s]
+    alias[s] = l
+    scaled[l] -= 1.0 - scaled[s]
+    (small if scaled[l] < 1.0 else large).append(l)
+  return probability, alias
+
+
+#
+class TrigramModel(object):
+
+  #
+  def __init__(self, tokens):
+    self.signature = tokenSignature(tokens)
+    ids, self.vocab = internTokens(tokens)
+    self.ids = array('l', ids)
+
+    counts = {}
+    for a, b, c in zip(ids, ids[1:], ids[2:]):
+      successors = counts.setdefault((a, b), {})
+      successors[c] = successors.get(c, 0) + 1
+
+    # `(a, b) -> (successors, probability, alias)`
+    self.table = {}
+    for context, successors in counts.iteritems():
+      tokens = sorted(successors)
+      probability, alias = aliasTable([successors[c] for c in tokens])
+      self.table[context] = (array('l', tokens), probability, alias)
+
+
+  # Draws the token after `context`, or None at a dead end (the context
+  # only occurs at the end of the text).
+  def next(self, context, rng):
+    entry = self.table.get(context)
+    if entry is None:
+      return None
+    successors, probability, alias = entry
+    i = int(rng.random() * len(successors))
+    if rng.random() < probability[i]:
+      return successors[i]
+    return successors[alias[i]]
+
+
+  # A starting context drawn by frequency: the pair at a random position.
+  def start(self, rng):
+    i = rng.randrange(len(self.ids) - 2)
+    return (self.ids[i], self.ids[i+1])
+
+
+  # Returns `length` generated tokens, reproducible for a given `seed`.
+  def generate(self, length=100, seed=42):
+    if len(self.ids) < 3:
+      return [self.vocab[i] for i in self.ids][:length]
+    rng = random.Random(seed)
+    context = self.start(rng)
+    ret = list(context)
+    while len(ret) < length:
+      token = self.next(context, rng)
+      if token is None:
+        context = self.start(rng)
+        ret.extend(context)
+        continue
+      ret.append(token)
+      context = (context[1], token)
+    return [self.vocab[i] for i in ret[:length]]
+
+
+  # Returns `count` texts of `length` tokens, wrapped like NLTK's output;
+  # text `i` is generated with seed `seed + i`.
+  def generateMany(self, count=1, length=100, seed=42):
+    return [textwrap.fill(' '.join(self.generate(length, seed + i)))
+            for i in range(count)]
+
+
+  #
+  def save(self, path):
+    savePickle(path, {'version':VERSION, 'model':self})
+
+
+
+# Returns the model saved at `path` if it was built from `tokens`, or
+# builds (and saves) a new one.
+def openTrigramModel(path, tokens):
+  data = loadPickle(path, {})
+  model = data.get('model')
+  if data.get('version') == VERSION and model.signature == tokenSignature(tokens):
+    return model
+
+  model = TrigramModel(tokens)
+  model.save(path)
+  return model
@@ -0,0 +1,135 @@
+# MIDI render targets
+# -------------------
+#
+# A dataset is rendered to several MIDI files that differ only in where
+# their notes start and how words are numbered (relative or absolute
+# indexing); the timing, loudness and note-off decisions for a token are
+# the same in all of them. The music algorithms therefore make one
+# *decision* per token, and a `MidiRender` writes it to each `MidiTarget`
+# with that file's note, so the tokens are walked once however many files
+# are written.
+#
+# A decision is `(channel, velocity, delta, off)`: the note is struck with
+# `velocity` on `channel` and held for `delta` ticks; `off` says whether
+# it is then released (`HOLD`, `OFF`), and whether the clock is reset
+# after the release (`OFF_RESET`).
+
+import os
+
+from midi.MidiOutFile import MidiOutFile
+from midi.DataTypeConverters import writeVar
+from midi.constants import NOTE_ON, NOTE_OFF
+
+
+HOLD      = 0
+OFF       = 1
+OFF_RESET = 2
+
+# Byte values as one-character strings.
+CHR = [chr(i) for i in range(256)]
+
+
+# One output file of a render.
+class MidiTarget(object):
+
+  # Creates the file at `path` and writes its header. `startnote` is the
+  # note of the first word; `absoluteIndexing` numbers words by their rank
+  # among distinct words instead of the position of their first occurrence.
+  def __init__(self, path, startnote, absoluteIndexing=False, tempo=250000):
+    self.path             = path
+    self.startnote        = startnote
+    self.absoluteIndexing = absoluteIndexing
+
+    dir = os.path.dirname(path)
+    if dir and not os.path.exists(dir):
+      os.makedirs(dir)
+
+    self.midi = MidiOutFile(path)
+    self.midi.header()
+    self.midi.start_of_track()
+    self.midi.tempo(tempo)
+    self.midi.time_signature(4, 2, 24, 8)
+
+    # The buffer `MidiOutFile` collects the track's event slices in.
+    self.track = self.midi._current_track_buffer
+
+
+  # Finalizes and writes the file.
+  def close(self):
+    self.midi.update_time(0)
+    self.midi.end_of_track()
+    self.midi.eof()
+
+
+
+# Writes the same decisions to several targets. The bytes of a token's
+# events only differ between targets in the note, so they are encoded
+# once per token (the event times, as `MidiOutFile` would write them,
+# included) and each target just writes them with its own note.
+class MidiRender(object):
+
+  #
+  def __init__(self, targets):
+    self.targets = targets
+    # The time before the next event; `MidiOutFile.update_time` semantics.
+    self.delta = 0
+
+
+  # Writes `decision` to every target, `notes[i]` being the token's note
+  # in `targets[i]`.
+  def emit(self, notes, decision):
+    channel, velocity, delta, off = decision
+    on  = writeVar(self.delta) + chr(NOTE_ON + channel)
+    vel = chr(velocity)
+    if off:
+      release = writeVar(delta) + chr(NOTE_OFF + channel)
+      for target, note in zip(self.targets, notes):
+        note = chr(note)
+        target.track.writeSlice(on + note + vel + release + note + '\x40')
+    else:
+      for target, note in zip(self.targets, notes):
+        target.track.writeSlice(on + chr(note) + vel)
+    self.delta = 0 if off == OFF_RESET else delta
+
+
+  # `emit` for a whole render: `columns[i]` holds the notes of
+  # `targets[i]`, `decisions` the decision of every token (e.g. zipped
+  # from `vectorized.decisionArrays`). The shared bytes of every token are
+  # encoded first (each distinct time once), then each target's track is
+  # joined and written in one go.
+  def emitAll(self, columns, decisions):
+    varlen = {}
+    shared = []
+    for channel, velocity, delta, off in decisions:
+      if self.delta not in varlen:
+        varlen[self.delta] = writeVar(self.delta)
+      on = varlen[self.delta] + CHR[NOTE_ON + channel]
+      release = None
+      if off:
+        if delta not in varlen:
+          varlen[delta] = writeVar(delta)
+        release = varlen[delta] + CHR[NOTE_OFF + channel]
+      shared.append((on, CHR[velocity], release))
+      self.delta = 0 if off == OFF_RESET else delta
+
+    for target, notes in zip(self.targets, columns):
+      target.track.writeSlice(''.join([on + CHR[note] + vel + (release + CHR[note] + '\x40' if release else '')
+                                       for (on, vel, release), note in zip(shared, notes)]))
+
+
+  #
+  def close(self):
+    for target in self.targets:
+      target.close()
+
+
+
+# Returns the tempo (microseconds per beat) of the first tempo event in
+# the MIDI file at `path`, or None if it has none.
+def readTempo(path):
+  data = open(path, 'rb').read()
+  i = data.find('\xff\x51\x03')
+  if i == -1:
+    return None
+  a, b, c = bytearray(data[i+3:i+6])
+  return (a << 16) | (b << 8) | c
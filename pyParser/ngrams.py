@@ -0,0 +1,717 @@
+# N-gram engines
+# --------------
+#
+# Faster ways to find the repeated n-grams `PoemParser.printAllNgrams`
+# reports than counting every window of every length in a dict.
+#
+# `RepeatIndex` maps the token stream to integer IDs and builds a suffix
+# array with its LCP array. Every repeated n-gram is a prefix shared by a
+# run of adjacent suffixes, so one walk over the LCP array yields all of
+# them, of any length, with their counts - in one pass instead of one per
+# n, and without ever materializing the n-grams that occur only once.
+#
+# `rollingRepeats` does the same with NumPy: a rolling hash over the ID
+# array counts all windows of one length at a time as arrays, and only
+# windows whose shorter prefix repeated are carried to the next length.
+# NumPy is optional; without it only the hash engine is unavailable.
+#
+# `StreamCounter` is for corpora whose n-grams don't fit in memory: a
+# Count-Min sketch picks the windows that may repeat, their exact counts
+# are spilled to disk in sorted runs whenever they outgrow the memory
+# budget, and the runs are merged back. A HyperLogLog per length
+# estimates how many distinct n-grams there were.
+#
+# `parallelCounts` counts every window like the plain dict engine, split
+# over a process pool: the token IDs are cut into shards that overlap by
+# `n-1` tokens, so each window is counted in exactly one shard, and the
+# partial tables are summed in a reduce step.
+#
+# Whichever engine counts them, the counts are kept in a `RankedCounts`,
+# which can list them most frequent first without re-sorting them all.
+
+from array import array
+import heapq
+from itertools import islice
+import marshal
+import math
+import multiprocessing
+import shutil
+import tempfile
+
+
+# Maps `tokens` to integer IDs in order of first appearance; returns the
+# ID list and the vocabulary (ID -> token).
+def internTokens(tokens):
+  ids   = {}
+  vocab = []
+  ret   = []
+  for token in tokens:
+    i = ids.get(token)
+    if i is None:
+      i = ids[token] = len(vocab)
+      vocab.append(token)
+    ret.append(i)
+  return ret, vocab
+
+
+# Builds the suffix array of the integer sequence `s` by prefix doubling:
+# each round sorts suffixes by their first `2k` symbols using the ranks
+# of the previous round, so it takes O(log n) sorts.
+def suffixArray(s):
+  n = len(s)
+  sa = range(n)
+  if n < 2:
+    return sa
+  rank = list(s)
+  k = 1
+  while True:
+    key = lambda i: (rank[i], rank[i+k] if i+k < n else -1)
+    sa.sort(key=key)
+    new = [0] * n
+    for j in xrange(1, n):
+      new[sa[j]] = new[sa[j-1]] + (key(sa[j]) != key(sa[j-1]))
+    rank = new
+    if rank[sa[-1]] == n-1:
+      return sa
+    k *= 2
+
+
+# Kasai's algorithm: `lcp[i]` is the length of the common prefix of the
+# suffixes `sa[i-1]` and `sa[i]` (`lcp[0]` is 0).
+def lcpArray(s, sa):
+  n = len(s)
+  rank = [0] * n
+  for i, suffix in enumerate(sa):
+    rank[suffix] = i
+  lcp = [0] * n
+  h = 0
+  for i in xrange(n):
+    if rank[i] > 0:
+      j = sa[rank[i]-1]
+      while i+h < n and j+h < n and s[i+h] == s[j+h]:
+        h += 1
+      lcp[rank[i]] = h
+      if h > 0:
+        h -= 1
+    else:
+      h = 0
+  return lcp
+
+
+#
+class RepeatIndex(object):
+
+  #
+  def __init__(self, tokens, interned=None):
+    self.tokens = tokens
+    self.ids, self.vocab = interned or internTokens(tokens)
+    self.sa  = suffixArray(self.ids)
+    self.lcp = lcpArray(self.ids, self.sa)
+
+
+  # Yields every LCP interval `(length, parent, lb, rb, leaf)`: the
+  # suffixes `sa[lb..rb]` share their first `length` tokens, and the
+  # enclosing interval shares `parent` tokens. So the n-grams starting at
+  # `sa[lb]` of lengths `parent+1 .. length` all occur exactly `rb-lb+1`
+  # times. `leaf` intervals have no nested interval: no token after the
+  # shared prefix occurs twice.
+  def intervals(self):
+    lcp = self.lcp
+    n = len(lcp)
+    stack = [[0, 0, False]]
+    for i in xrange(1, n+1):
+      current = lcp[i] if i < n else 0
+      lb = i-1
+      popped = False
+      while current < stack[-1][0]:
+        length, lb, nested = stack.pop()
+        yield (length, max(current, stack[-1][0]), lb, i-1, not nested)
+        popped = True
+        if current <= stack[-1][0]:
+          stack[-1][2] = True
+      if current > stack[-1][0]:
+        stack.append([current, lb, popped])
+
+
+  # Yields `(start, length, lb, rb)` for every distinct repeated n-gram
+  # with `minlen <= n <= maxlen` (`maxlen=None` means no limit): it starts
+  # at token `start` and occurs at `sa[lb..rb]`.
+  def repeats(self, minlen=2, maxlen=None):
+    for length, parent, lb, rb, leaf in self.intervals():
+      if maxlen is not None:
+        length = min(length, maxlen)
+      start = self.sa[lb]
+      for n in xrange(max(parent+1, minlen), length+1):
+        yield (start, n, lb, rb)
+
+
+  # Like `repeats`, but only the closed repeats: n-grams that no longer
+  # reported n-gram contains with the same count. Within an interval only
+  # the longest n-gram qualifies (the shorter ones extend to the right),
+  # and only if its occurrences aren't all preceded by the same token.
+  def closedRepeats(self, minlen=2, maxlen=None):
+    for length, parent, lb, rb, leaf in self.intervals():
+      n = length if maxlen is None else min(length, maxlen)
+      if n < max(parent+1, minlen):
+        continue
+      if n != maxlen and not self.leftDiverse(lb, rb):
+        continue
+      yield (self.sa[lb], n, lb, rb)
+
+
+  # Like `repeats`, but only the maximal repeats: n-grams that no longer
+  # reported repeat contains at all. That needs a leaf interval and a
+  # different preceding token at every occurrence.
+  def maximalRepeats(self, minlen=2, maxlen=None):
+    for length, parent, lb, rb, leaf in self.intervals():
+      n = length if maxlen is None else min(length, maxlen)
+      if n < max(parent+1, minlen):
+        continue
+      if n != maxlen and not (leaf and self.leftUnique(lb, rb)):
+        continue
+      yield (self.sa[lb], n, lb, rb)
+
+
+  # Does any occurrence in `sa[lb..rb]` have a different preceding token
+  # than another (the start of the text counts as a token of its own)?
+  def leftDiverse(self, lb, rb):
+    before = set(self.ids[i-1] if i else -1 for i in self.sa[lb:rb+1])
+    return len(before) > 1
+
+
+  # Do all occurrences in `sa[lb..rb]` have different preceding tokens?
+  def leftUnique(self, lb, rb):
+    before = [self.ids[i-1] for i in self.sa[lb:rb+1] if i]
+    return len(set(before)) == len(before)
+
+
+  # Returns `(start, n)` of each repeat `kind` ('all', 'closed' or
+  # 'maximal') selects.
+  def select(self, kind='all', minlen=2, maxlen=None):
+    finder = {'all':self.repeats, 'closed':self.closedRepeats, 'maximal':self.maximalRepeats}[kind]
+    return [(start, n) for start, n, lb, rb in finder(minlen, maxlen)]
+
+
+  # Returns `{ngram: count}` for every repeated n-gram, like `allmatch`
+  # restricted to counts above 1. If `positions` is given, the sorted
+  # start offsets of each n-gram (its interval of the suffix array) are
+  # stored in it too; the n-grams of one interval share a list.
+  def counts(self, minlen=2, maxlen=None, positions=None):
+    tokens = self.tokens
+    ret = {}
+    interval, starts = None, None
+    for start, n, lb, rb in self.repeats(minlen, maxlen):
+      key = tuple(tokens[start:start+n])
+      ret[key] = rb - lb + 1
+      if positions is not None:
+        if interval != (lb, rb):
+          interval, starts = (lb, rb), sorted(self.sa[lb:rb+1])
+        positions[key] = starts
+    return ret
+
+
+
+# Ranked counts
+# -------------
+
+# A `{key: count}` mapping whose keys can be listed most frequent first,
+# or down to a count, by walking the (few) distinct counts from the top.
+# Keys with the same count come out in key order, so the listing doesn't
+# depend on how or in which order the counts were made.
+#
+# Setting a count only touches the dict; the keys are bucketed by count
+# once, on the first listing after a change, so counting costs no more
+# than with a plain dict.
+class RankedCounts(object):
+
+  #
+  def __init__(self, counts=None):
+    self.counts  = dict(counts or {})
+    self.buckets = None
+
+  #
+  def __len__(self):
+    return len(self.counts)
+
+  #
+  def __contains__(self, key):
+    return key in self.counts
+
+  #
+  def __iter__(self):
+    return iter(self.counts)
+
+  #
+  def __getitem__(self, key):
+    return self.counts[key]
+
+  #
+  def get(self, key, default=None):
+    return self.counts.get(key, default)
+
+  #
+  def keys(self):
+    return self.counts.keys()
+
+  #
+  def items(self):
+    return self.counts.items()
+
+  #
+  def __setitem__(self, key, count):
+    self.counts[key] = count
+    self.buckets = None
+
+  #
+  def __delitem__(self, key):
+    del self.counts[key]
+    self.buckets = None
+
+  # Sets many counts at once, e.g. a whole n-gram length.
+  def update(self, counts):
+    self.counts.update(counts)
+    self.buckets = None
+
+  #
+  def increment(self, key, by=1):
+    self[key] = self.counts.get(key, 0) + by
+
+
+  # `{count: [key, ...]}`, rebuilt if the counts changed since last time.
+  def rank(self):
+    if self.buckets is None:
+      self.buckets = {}
+      for key, count in self.counts.iteritems():
+        self.buckets.setdefault(count, []).append(key)
+    return self.buckets
+
+  # Yields `(key, count)` most frequent first, stopping below `minimum`.
+  # Only the buckets actually reached are sorted.
+  def ranked(self, minimum=None):
+    buckets = self.rank()
+    for count in sorted(buckets, reverse=True):
+      if minimum is not None and count < minimum:
+        return
+      for key in sorted(buckets[count]):
+        yield key, count
+
+  #
+  def top(self, k):
+    return list(islice(self.ranked(), k))
+
+  #
+  def atLeast(self, threshold):
+    return list(self.ranked(threshold))
+
+  # Every key counted more than once, most frequent first.
+  def repeats(self):
+    return [key for key, count in self.ranked(2)]
+
+  # Pickled as plain counts; the buckets are rebuilt when next needed.
+  def __getstate__(self):
+    return self.counts
+
+  #
+  def __setstate__(self, counts):
+    self.counts  = counts
+    self.buckets = None
+
+
+# Occurrences
+# -----------
+
+# Returns `{ngram: [start, ...]}` with the sorted start offsets of every
+# occurrence of each of `ngrams` in `tokens`, in one pass per n-gram
+# length.
+def ngramPositions(tokens, ngrams):
+  ret = dict((ngram, []) for ngram in ngrams)
+  for n in sorted(set(len(ngram) for ngram in ngrams)):
+    for i in xrange(len(tokens) - n + 1):
+      starts = ret.get(tuple(tokens[i:i+n]))
+      if starts is not None:
+        starts.append(i)
+  return ret
+
+
+# `[5, 9, 30]` -> `[5, 4, 21]`: the first value, then the gaps.
+def deltaEncode(values):
+  return [b - a for a, b in zip([0] + values, values)]
+
+
+# Rolling-hash counting
+# ---------------------
+
+# Odd multiplier of the rolling hash; arithmetic wraps modulo 2**64.
+HASH_BASE = 0x9E3779B97F4A7C15
+
+
+# Yields `(n, starts, counts, pos, offsets)` for `n` from `minlen` up to
+# `maxlen` (no limit if None): NumPy arrays with one entry per distinct
+# n-gram of `ids` that occurs more than once - its first position, its
+# count, and where its positions begin in `pos`, which holds the
+# positions of all occurrences, each n-gram's in order. Stops as soon as
+# no n-gram of a length repeats. NumPy is only imported here,
+# so the other engines never pay for loading it.
+def rollingRepeats(ids, minlen=2, maxlen=None):
+  try:
+    import numpy
+  except ImportError:
+    raise ImportError("the hash n-gram engine needs NumPy")
+
+  ids   = numpy.asarray(ids, dtype=numpy.uint64) + numpy.uint64(1)
+  total = len(ids)
+  base  = numpy.uint64(HASH_BASE)
+  pos   = numpy.arange(total)
+  h     = ids.copy()
+  n     = 1
+  while len(pos) and (maxlen is None or n <= maxlen):
+    # Group equal hashes, each group in position order.
+    order = numpy.lexsort((pos, h))
+    h, pos = h[order], pos[order]
+    runs = numpy.concatenate(([True], h[1:] != h[:-1]))
+
+    # Distinct hashes are distinct n-grams, so only repeated hashes are
+    # checked against the real windows; a collision falls back to exact
+    # (lexicographic) grouping.
+    runid = numpy.cumsum(runs) - 1
+    keep  = numpy.bincount(runid)[runid] > 1
+    h, pos, runs = h[keep], pos[keep], runs[keep]
+    if not len(pos):
+      break
+    windows = ids[pos[:, None] + numpy.arange(n)]
+    first   = numpy.maximum.accumulate(numpy.where(runs, numpy.arange(len(pos)), 0))
+    if not (windows == windows[first]).all():
+      order = numpy.lexsort(numpy.vstack((pos, windows.T[::-1])))
+      h, pos, windows = h[order], pos[order], windows[order]
+      runs = numpy.concatenate(([True], (windows[1:] != windows[:-1]).any(axis=1)))
+      runid = numpy.cumsum(runs) - 1
+      keep  = numpy.bincount(runid)[runid] > 1
+      h, pos, runs = h[keep], pos[keep], runs[keep]
+
+    if n >= minlen:
+      starts = numpy.flatnonzero(runs)
+      counts = numpy.diff(numpy.append(starts, len(pos)))
+      order  = numpy.argsort(pos[starts], kind='mergesort')
+      yield (n, pos[starts][order], counts[order], pos, starts[order])
+
+    # An (n+1)-gram can only repeat if its first n tokens do.
+    more = pos + n < total
+    h, pos = h[more] * base + ids[pos[more] + n], pos[more]
+    n += 1
+
+
+# Returns `{ngram: count}` for every repeated n-gram of `tokens`, like
+# `RepeatIndex.counts`, filling in `positions` the same way if given;
+# `interned` is `internTokens(tokens)` if already known. Tuples are only
+# built for the n-grams that repeat.
+def hashCounts(tokens, minlen=2, maxlen=None, interned=None, positions=None):
+  ids, vocab = interned or internTokens(tokens)
+  ret = {}
+  for n, starts, counts, pos, offsets in rollingRepeats(ids, minlen, maxlen):
+    pos = pos.tolist() if positions is not None else None
+    for start, count, offset in zip(starts.tolist(), counts.tolist(), offsets.tolist()):
+      key = tuple(tokens[start:start+n])
+      ret[key] = count
+      if pos is not None:
+        positions[key] = pos[offset:offset+count]
+  return ret
+
+
+
+# Parallel counting
+# -----------------
+#
+# A map/reduce over a process pool, one round per n-gram length. Each map
+# task counts the windows that start in its shard of the token IDs
+# (reading `n-1` tokens into the next shard) and writes its table, split
+# into partitions by first token, to a scratch directory. Each reduce
+# task sums one partition over all shards - every n-gram lands in exactly
+# one partition, so those sums are final - and returns just the repeats.
+# A window is only counted if its first `n-1` tokens repeated in the
+# previous round, so the tables hold little more than the repeats, and
+# each round only revisits the positions the previous one counted.
+
+# The token IDs being counted; set before the pool is forked, so workers
+# inherit them rather than being sent a copy with every shard.
+_shardIds = []
+
+
+#
+def _dump(path, data):
+  f = open(path, 'wb')
+  try:
+    marshal.dump(data, f)
+  finally:
+    f.close()
+
+#
+def _load(path):
+  f = open(path, 'rb')
+  try:
+    return marshal.load(f)
+  finally:
+    f.close()
+
+
+# Map task: counts the `n`-grams that start in `[start, end)` and whose
+# prefix is one of the previous round's repeats. Only positions whose
+# prefix was counted in the previous round are tried.
+def _countShard(job):
+  shard, start, end, n, partitions, dir = job
+  ids = _shardIds
+  stop = min(end, len(ids) - n + 1)
+  if n == 1:
+    previous, candidates = None, xrange(start, stop)
+  else:
+    previous, candidates = _load("%s/repeats" % dir), _load("%s/%s.positions" % (dir, shard))
+  tables = [{} for p in range(partitions)]
+  counted = []
+  for i in candidates:
+    if i >= stop:
+      break
+    key = tuple(ids[i:i+n])
+    if previous is None or key[:-1] in previous:
+      table = tables[key[0] % partitions]
+      table[key] = table.get(key, 0) + 1
+      counted.append(i)
+  for p, table in enumerate(tables):
+    _dump("%s/%s.%s" % (dir, shard, p), table)
+  _dump("%s/%s.positions" % (dir, shard), counted)
+
+
+# Reduce task: sums partition `p` over all shards; returns the n-grams
+# counted more than once.
+def _reducePartition(job):
+  p, shards, dir = job
+  total = {}
+  for shard in range(shards):
+    for key, count in _load("%s/%s.%s" % (dir, shard, p)).iteritems():
+      total[key] = total.get(key, 0) + count
+  return dict((key, count) for key, count in total.iteritems() if count > 1)
+
+
+# Returns `{ngram: count}` for every repeated n-gram of `tokens` with
+# `minlen <= n <= maxlen` (no limit if None), counted in `jobs` worker
+# processes - the counts `PoemParser.ngramFinder` finds. `interned` is
+# `internTokens(tokens)` if already known.
+def parallelCounts(tokens, jobs, minlen=2, maxlen=None, interned=None, tmpdir=None):
+  global _shardIds
+  ids, vocab = interned or internTokens(tokens)
+  size = max(1, -(-len(ids) // jobs))
+  starts = range(0, len(ids), size)
+  partitions = jobs * 4
+  dir = tempfile.mkdtemp(prefix='ngrams', dir=tmpdir)
+
+  # Pool workers (`parser.py --jobs`) can't start pools of their own;
+  # they run the tasks themselves.
+  ret = {}
+  _shardIds = ids
+  pool = None
+  if jobs > 1 and not multiprocessing.current_process().daemon:
+    pool = multiprocessing.Pool(jobs)
+  run = pool.map if pool else lambda task, jobs, chunks: map(task, jobs)
+  try:
+    n = 1
+    while maxlen is None or n <= maxlen:
+      run(_countShard, [(shard, start, start+size, n, partitions, dir)
+                        for shard, start in enumerate(starts)], 1)
+      repeats = {}
+      for table in run(_reducePartition, [(p, len(starts), dir) for p in range(partitions)], 1):
+        repeats.update(table)
+      if not repeats:
+        break
+      if n >= minlen:
+        for key, count in repeats.iteritems():
+          ret[tuple([vocab[i] for i in key])] = count
+      _dump("%s/repeats" % dir, set(repeats))
+      n += 1
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+    _shardIds = []
+    shutil.rmtree(dir, True)
+  return ret
+
+
+# Streaming counting
+# ------------------
+
+MASK64 = (1 << 64) - 1
+
+# Spreads the bits of Python's `hash` over all 64 bits (the `splitmix64`
+# finalizer), so sketch cells and HyperLogLog registers are uniform.
+def mix64(h):
+  h &= MASK64
+  h = ((h ^ (h >> 33)) * 0xff51afd7ed558ccd) & MASK64
+  h = ((h ^ (h >> 33)) * 0xc4ceb9fe1a85ec53) & MASK64
+  return h ^ (h >> 33)
+
+
+# Approximate counts in `depth` rows of `width` counters. Estimates never
+# undercount, so `estimate(h) > 1` misses no repeated n-gram.
+class CountMinSketch(object):
+
+  #
+  def __init__(self, width, depth=4):
+    self.width = width
+    self.depth = depth
+    self.rows  = [array('I', [0]) * width for i in range(depth)]
+
+  # One cell per row, by double hashing.
+  def cells(self, h):
+    h1, h2 = h & 0xffffffff, (h >> 32) | 1
+    return [(h1 + i*h2) % self.width for i in range(self.depth)]
+
+  #
+  def add(self, h):
+    for row, cell in zip(self.rows, self.cells(h)):
+      row[cell] += 1
+
+  #
+  def estimate(self, h):
+    return min(row[cell] for row, cell in zip(self.rows, self.cells(h)))
+
+
+
+# Estimates the number of distinct hashes added, in `2**p` bytes (about
+# 1.6% standard error with the default `p`).
+class HyperLogLog(object):
+
+  #
+  def __init__(self, p=12):
+    self.p = p
+    self.m = 1 << p
+    self.registers = bytearray(self.m)
+
+  #
+  def add(self, h):
+    register = h >> (64 - self.p)
+    rest = (h << self.p) & MASK64
+    rank = min(64 - rest.bit_length(), 64 - self.p) + 1
+    if rank > self.registers[register]:
+      self.registers[register] = rank
+
+  #
+  def count(self):
+    m = self.m
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+    zeros = self.registers.count('\0')
+    if estimate <= 2.5 * m and zeros:
+      estimate = m * math.log(float(m) / zeros)
+    return int(round(estimate))
+
+
+
+# Counts repeated n-grams in bounded memory. `budget` (bytes) covers the
+# sketch and the exact counts held before a spill; the returned repeats
+# themselves are not counted against it.
+class StreamCounter(object):
+
+  # Rough size of one exact count in memory: the tuple plus its dict slot,
+  # not counting the (shared) token strings.
+  ENTRY_BYTES = 150
+
+  #
+  def __init__(self, budget=64*1024*1024, tmpdir=None):
+    self.budget   = budget
+    self.tmpdir   = tmpdir
+    self.width    = max(1024, budget / 4 / (4 * 4))
+    self.distinct = {}
+    self.spills   = 0
+
+
+  # Exact counts held in memory before they are spilled to disk.
+  def maxEntries(self, n):
+    return max(1000, (self.budget - self.width * 4 * 4) / (self.ENTRY_BYTES + 8*n))
+
+
+  # Returns `{ngram: count}` for every repeated n-gram, like
+  # `RepeatIndex.counts`, and leaves a distinct-n-gram estimate per length
+  # in `distinct`. Each length takes two passes over the tokens: one
+  # sketching the windows that may still repeat, one counting the windows
+  # the sketch says do.
+  def counts(self, tokens, minlen=2, maxlen=None):
+    total = len(tokens)
+    ret = {}
+    self.distinct = {}
+    self.spills = 0
+
+    # Windows that can start a repeat: those whose shorter prefix might.
+    candidate = bytearray([1]) * total
+    n = 1
+    while total - n >= 1 and (maxlen is None or n <= maxlen):
+      windows = xrange(total - n + 1)
+      sketch = CountMinSketch(self.width)
+      hll = HyperLogLog()
+      for i in windows:
+        h = mix64(hash(tuple(tokens[i:i+n])))
+        hll.add(h)
+        if candidate[i]:
+          sketch.add(h)
+
+      runs = []
+      counts = {}
+      limit = self.maxEntries(n)
+      for i in windows:
+        if not candidate[i]:
+          continue
+        key = tuple(tokens[i:i+n])
+        if sketch.estimate(mix64(hash(key))) < 2:
+          candidate[i] = 0
+          continue
+        counts[key] = counts.get(key, 0) + 1
+        if len(counts) >= limit:
+          runs.append(self.spill(counts))
+          counts = {}
+      for i in xrange(total - n + 1, total):
+        candidate[i] = 0
+
+      if runs:
+        runs.append(self.spill(counts))
+        level = dict(self.merge(runs))
+      else:
+        level = dict((key, count) for key, count in counts.iteritems() if count > 1)
+      if n >= minlen:
+        ret.update(level)
+        self.distinct[n] = hll.count()
+      if not level:
+        break
+      n += 1
+    return ret
+
+
+  # Writes `counts` to a temporary file, sorted by n-gram.
+  def spill(self, counts):
+    self.spills += 1
+    f = tempfile.TemporaryFile(dir=self.tmpdir)
+    for item in sorted(counts.iteritems()):
+      marshal.dump(item, f)
+    return f
+
+
+  # Merges sorted runs, yielding `(ngram, count)` for every n-gram whose
+  # total count is above 1.
+  def merge(self, runs):
+    current, count = None, 0
+    for key, c in heapq.merge(*[readRun(f) for f in runs]):
+      if key != current:
+        if count > 1:
+          yield current, count
+        current, count = key, 0
+      count += c
+    if count > 1:
+      yield current, count
+    for f in runs:
+      f.close()
+
+
+#
+def readRun(f):
+  f.seek(0)
+  while True:
+    try:
+      yield marshal.load(f)
+    except EOFError:
+      return
@@ -13,113 +13,273 @@
 # Imports
 # -------
 
-from curses.ascii import isdigit 
 from random import *
 import string
 import getopt
 import sys
+import os
+import re
+import time
+import fnmatch
+import traceback
+import multiprocessing
+import hashlib
+import zlib
 
 # [Natural Language Toolkit (NLTK)](http://www.nltk.org) for
-# language / poem analysis.
-import nltk
-from nltk import Nonterminal, nonterminals, Production, parse_cfg, ContextFreeGrammar, FreqDist
-from nltk.corpus import cmudict
-from nltk.collocations import *
-from nltk.util import *
-from nltk.tokenize import WhitespaceTokenizer
+# language / poem analysis. NLTK is reached through a backend (`--backend
+# nltk|lite`), which imports it and loads its models lazily, the first
+# time a stage needs them (see `lazyproperty`); the `lite` backend never
+# imports it at all.
+from backends import getBackend
+
+_importStart = time.time()
+
+# Memory-mapped word list / CMU pronouncing dictionary index.
+from lexicon import openLexicon
+
+# Per-token feature columns shared by all renders.
+from features import TokenFeatures
+
+# Persistent per-line POS tag cache.
+from tagcache import TagCache, modelSignature
 
 # [EchoNest Remix API](http://code.google.com/p/echo-nest-remix/) for
-# programmatic MIDI music synthesis.
-from midi.MidiOutFile import MidiOutFile
+# programmatic MIDI music synthesis, written by one-pass multi-file renders.
+from midirender import MidiTarget, MidiRender, HOLD, OFF, OFF_RESET
+
+# Line-level analysis state for `--incremental` reruns.
+from incremental import AnalysisState, lineHash, updateNgramCounts, affectedWords
+
+# Repeat finders for `--ngram-engine suffix`, `hash`, `stream` and `parallel`.
+from ngrams import RepeatIndex, StreamCounter, RankedCounts, hashCounts, parallelCounts, \
+  internTokens, ngramPositions, deltaEncode
+
+# One-pass keyword-in-context index for the concordances.
+from concordance import ConcordanceIndex, concordancePath
+
+# Trigram pseudo-text generator.
+from markov import openTrigramModel
+
+# Cross-dataset word and phrase index for `--index`.
+from corpusindex import updateCorpusIndex
+
+# Per-stage wall/CPU/memory profiling for `--profile`.
+from profiler import StageProfiler, NullProfiler
+
+_importTime = time.time() - _importStart
+
+# The tempo `runAll` renders its songs at, in microseconds per beat.
+SONG_TEMPO = 125000
+
+
+# An attribute that is computed by its method on first access and then
+# cached on the instance, so expensive resources (the POS tagger, the
+# Markov model, the lexicon) are only loaded by stages that use them.
+class lazyproperty(object):
+
+  #
+  def __init__(self, func):
+    self.func     = func
+    self.__name__ = func.__name__
+    self.__doc__  = func.__doc__
+
+  #
+  def __get__(self, obj, cls):
+    if obj is None:
+      return self
+    value = obj.__dict__[self.__name__] = self.func(obj)
+    return value
 
 
 
 #
-class PoemParser():
+class PoemParser(object):
 
   #
   def __init__(self, dataset="picasso2", basedir="parsed_data"):
     self.dataset = dataset
     self.basedir = basedir
+    self.backend = getBackend(args['backend'])
     filename = "%s/%s/source/%s" % (basedir,dataset,dataset)
     self.debug("poemparser:init:dataset parsing '%s'..." % filename)
 
-    with open("pyParser/english_words.txt") as word_file:
-      self.english_words = set(word.strip().lower() for word in word_file)
+    if args['profile']:
+      self.profiler = StageProfiler()
+      self.profiler.add('import:parser', _importTime)
+    else:
+      self.profiler = NullProfiler()
+
+    # With `--incremental`, what the previous run of this dataset left
+    # behind; cleaned lines are reused from it either way.
+    if args['incremental']:
+      self.state      = AnalysisState("%s/%s/.state/analysis.pickle" % (basedir, dataset))
+      self.lineTokens = self.state.lineTokens
+    else:
+      self.state      = None
+      self.lineTokens = {}
 
     # Open and analyze the text data.
     self.unknownWords   = {}
     self.iffyWords      = {}
-    self.allmatch       = {}
-    self.alltokens      = self.openTokens(filename)
+    self.allmatch       = RankedCounts()
+    # Where each repeated n-gram starts, if the counting engine kept it.
+    self.ngramStarts    = None
+    self.ngramStats     = None
+    with self.profiler.stage('openTokens'):
+      self.alltokens    = self.openTokens(filename)
     self.parsedTokens   = [token for token in self.alltokens[0] if token != '-']
     self.replacedTokens = [token for token in self.alltokens[1] if token != '-']
     self.fullTokens     = [token for token in self.alltokens[2] if token != '-']
+    self.tokenLines     = [line for token, line in zip(self.alltokens[1], self.alltokens[3]) if token != '-']
     self.tokens         = self.parsedTokens
     self.loweredTokens  = [token.lower() for token in self.replacedTokens]
-    self.pos_tags       = nltk.pos_tag(self.replacedTokens)
-    self.text           = nltk.Text(self.tokens)
-    self.dict           = cmudict.dict() 
     self.lastspeed      = 0
-    self.midiindex      = 0
+
+    # Token ranges edited since the previous `--incremental` run, if any.
+    if self.state is not None:
+      self.changes = self.state.changes(self.lineHashes, self.tokenLines)
+    else:
+      self.changes = None
     
     self.setMIDISettings(12)
     
     self.debug("poemparser:init:words %s"  % self.fullTokens)
     self.debug("poemparser:init:tokens %s" % self.tokens)
-    self.debug("poemparser:init:text %s"   % self.text)
+
+  # The english word list and cmudict are served from a shared,
+  # memory-mapped index that is only rebuilt when its sources change.
+  @lazyproperty
+  def lexicon(self):
+    with self.profiler.stage('load:lexicon'):
+      return openLexicon()
+
+  # The per-token feature table shared by every render and the JSON writer.
+  @lazyproperty
+  def features(self):
+    with self.profiler.stage('features'):
+      return TokenFeatures(self.parsedTokens, self.replacedTokens, self.fullTokens,
+                           self.phonetics, lambda: self.pos_tags)
+
+  # Part-of-speech tags for `replacedTokens`; only the JSON writer and
+  # verbose MIDI logging need them. Lines that were tagged before, in this
+  # or any other dataset, come from the shared tag cache.
+  @lazyproperty
+  def pos_tags(self):
+    with self.profiler.stage('load:tagger'):
+      tagger = self.backend.tagger()
+      cache  = sharedTagCache(self.basedir, tagger)
+    with self.profiler.stage('tag'):
+      tags = cache.tag(self.replacedTokens, self.tokenLines, tagger)
+      cache.save()
+    if args['verbose'] or args['profile']:
+      print "poemparser:tagcache %s" % cache.stats()
+    return tags
+
+  # Trigram model for pseudo-text generation, saved with the dataset and
+  # only rebuilt when its tokens change.
+  @lazyproperty
+  def markov(self):
+    with self.profiler.stage('load:markov'):
+      return openTrigramModel("%s/%s/.index/markov.pickle" % (self.basedir, self.dataset), self.tokens)
  
   #
   def runAll(self):
-    # Print interesting NLTK data.
-    self.printAllNgrams()
-    self.printAllConcordance()
-    self.generatePseudoText(300)   
-
-    tempo = 125000
-
-    # Render MIDI files.
-    self.createMIDIFile('%s70.mid'  % self.dataset, 70,  tempo)
-    self.createMIDIFile('%s100.mid' % self.dataset, 100, tempo)
-    self.createMIDIFile('%s130.mid' % self.dataset, 130, tempo)
-    
-    self.createMIDIFile('%s30_abs.mid'  % self.dataset, 30,  tempo, True)
-    self.createMIDIFile('%s90_abs.mid'  % self.dataset, 90,  tempo, True)
-    self.createMIDIFile('%s120_abs.mid' % self.dataset, 120, tempo, True)
-
-
-    if False:
-      self.createMIDIFile('%s30.mid'  % self.dataset, 30,  tempo) 
-      self.createMIDIFile('%s90.mid'  % self.dataset, 90,  tempo)
-      self.createMIDIFile('%s120.mid' % self.dataset, 120, tempo)
-      self.createMIDIFile('%s70_abs.mid'  % self.dataset, 70,  tempo, True)
-      self.createMIDIFile('%s100_abs.mid' % self.dataset, 100, tempo, True)
-      self.createMIDIFile('%s130_abs.mid' % self.dataset, 130, tempo, True)
-
-    # Generate JSON datafile.
-    self.generateJSON(70)
-
-    for s in sorted(self.unknownWords.keys()):
-      self.debug("Iffy word: (BAD!) [ %s (%s) ]"%(s, self.unknownWords[s]), '')
-    for s in sorted(self.iffyWords.keys()):
-      self.debug("Iffy word:        [ %s (%s) ]"%(s, self.iffyWords[s]), '')
-
-
-  #
-  def createMIDIFile(self, filename, startnote, tempo=250000, absoluteIndexing=False):
-    self.debug("poemparser:createMIDIFile:filename %s"%filename)
-    self.__midistart(filename)
-
-    self.pos_tag_iter = (pos for (word, pos) in self.pos_tags)
-
-    for i, token in enumerate(self.parsedTokens):
-      if i > 0:
-        lastword = self.fullTokens[i-1]
-        self.__midiadd(i, token, lastword, startnote, absoluteIndexing)
+    try:
+      # Print interesting NLTK data.
+      with self.profiler.stage('printAllNgrams'):
+        self.printAllNgrams()
+      with self.profiler.stage('saveConcordance'):
+        self.saveConcordance()
+      if args['concord'] or args['verbose']:
+        with self.profiler.stage('printAllConcordance'):
+          self.printAllConcordance()
+      with self.profiler.stage('generatePseudoText'):
+        self.generatePseudoText(300)   
+
+      tempo = SONG_TEMPO
+
+      files = [('%s70.mid'  % self.dataset, 70,  False),
+               ('%s100.mid' % self.dataset, 100, False),
+               ('%s130.mid' % self.dataset, 130, False),
+
+               ('%s30_abs.mid'  % self.dataset, 30,  True),
+               ('%s90_abs.mid'  % self.dataset, 90,  True),
+               ('%s120_abs.mid' % self.dataset, 120, True)]
+
+      # Render MIDI files: with `--render-jobs`, one seeded job per file and
+      # settings version in a process pool; otherwise all the files of a
+      # settings version in one pass over the tokens.
+      if args['renderJobs'] > 1:
+        self.scheduleMIDIRenders([(version,) + file for version in args['midiSettings'] for file in files],
+                                 tempo, args['renderJobs'])
       else:
-        self.__midiadd(i, token, None, startnote, absoluteIndexing)
+        settings = self.settings
+        for version in args['midiSettings']:
+          self.setMIDISettings(version)
+          self.createMIDIFiles(files, tempo)
+        self.settings = settings
+
+
+      if False:
+        self.createMIDIFile('%s30.mid'  % self.dataset, 30,  tempo) 
+        self.createMIDIFile('%s90.mid'  % self.dataset, 90,  tempo)
+        self.createMIDIFile('%s120.mid' % self.dataset, 120, tempo)
+        self.createMIDIFile('%s70_abs.mid'  % self.dataset, 70,  tempo, True)
+        self.createMIDIFile('%s100_abs.mid' % self.dataset, 100, tempo, True)
+        self.createMIDIFile('%s130_abs.mid' % self.dataset, 130, tempo, True)
+
+      # Generate JSON datafile.
+      with self.profiler.stage('generateJSON'):
+        self.generateJSON(70)
+      with self.profiler.stage('generateRhymeJSON'):
+        self.generateRhymeJSON()
+
+      for s in sorted(self.unknownWords.keys()):
+        self.debug("Iffy word: (BAD!) [ %s (%s) ]"%(s, self.unknownWords[s]), '')
+      for s in sorted(self.iffyWords.keys()):
+        self.debug("Iffy word:        [ %s (%s) ]"%(s, self.iffyWords[s]), '')
+
+      if self.state is not None:
+        self.state.save(self.lineHashes, self.tokenLines, self.tokens,
+                        self.loweredTokens, self.allmatch, self.ngramKey())
+
+      if self.profiler.enabled:
+        self.writeProfile()
+    finally:
+      self.profiler.close()
+
+
+  # Writes the `--profile` report next to the dataset's other outputs.
+  def writeProfile(self):
+    report = self.profiler.dumps(dataset=self.dataset,
+                                 tokens=len(self.tokens),
+                                 vocabulary=len(set(self.tokens)),
+                                 bytes=sum(len(token)+1 for token in self.fullTokens),
+                                 started=int(self.profiler.started),
+                                 ngrams=self.ngramStats)
+    self.dumpfile('profile', "%s_profile.json" % self.dataset, report)
+
+
+  # Returns a signature of everything an output rendered with `params`
+  # depends on: the tokens, the backend, the current settings and `params`
+  # themselves. Outputs that depend on more (the tagger model, the render
+  # mode) pass it in `params`.
+  def outputSignature(self, *params):
+    data = repr((self.parsedTokens, self.replacedTokens, self.fullTokens, self.backend.name,
+                 sorted(self.settings.items()), params))
+    return hashlib.sha1(data).hexdigest()
+
+
+  # With `--incremental`, is the output at `path` still up to date?
+  def isOutputCurrent(self, path, *params):
+    if self.state is None:
+      return False
+    if self.state.isCurrent(path, self.outputSignature(*params)):
+      self.debug("poemparser:incremental %s is unchanged" % path)
+      return True
+    return False
 
-    self.__midiend()
 
 
   # Output Configuration Settings
@@ -236,9 +396,10 @@ class PoemParser():
     return int(random()*10)
 
 
-  # Returns a length of time determined by the number of syllables in the word.
-  def addTimeForSyllables(self, word):
-    return (self.numsyl(word)[0]-1)*100
+  # Returns a length of time determined by the number of syllables in the
+  # word at token `index`.
+  def addTimeForSyllables(self, index):
+    return (self.features.numsyl[index]-1)*100
 
 
   # **ISSUE** - *these next two methods are crude and can obviously have 
@@ -246,39 +407,36 @@ class PoemParser():
   # created they are sufficient.*
   
   
-  # Returns a random length of time (100ms - 500ms) if a period is found.
-  def addTimeForSentenceEnd(self, lastfullword):
-    try:
-      if lastfullword.find('.') != -1:
-        return int(random()*400)+100
-    except:
-      pass              
+  # Returns a random length of time (100ms - 500ms) if a period is found
+  # in the full word preceding token `index`.
+  def addTimeForSentenceEnd(self, index):
+    if self.features.sentenceEnd[index]:
+      return int(random()*400)+100
     return 0
 
 
-  # Returns a random length of time (80ms - 380ms) if a comma is found.
-  def addTimeForSentencePause(self, lastfullword, span=300, off=80):
-    try:
-      if lastfullword.find(',') != -1:
-        return int(random()*span)+off
-    except:
-      pass              
+  # Returns a random length of time (80ms - 380ms) if a comma is found
+  # in the full word preceding token `index`.
+  def addTimeForSentencePause(self, index, span=300, off=80):
+    if self.features.sentencePause[index]:
+      return int(random()*span)+off
     return 0
 
 
   # Returns a loudness metric based on the word count; the more frequently
   # a word is used, the louder it will become.
   def addLoudnessForCount(self, count, boost=0):
-    try:
-      return self.settings['loudness']-40+2*count+boost
-    except:
-      pass              
-    return 0
+    return self.settings['loudness']-40+2*count+boost
 
 
-  # Returns the resolved note index for the current `word`.
-  def getNoteIndex(self, absindex, word, startnote):
-    i = self.midiwordinfo[word][1]
+  # Returns the resolved note index for the word at token `index`.
+  # Relative indexing numbers each word by the position of its first
+  # occurrence, absolute indexing by its rank among distinct words.
+  def getNoteIndex(self, index, startnote, absoluteIndexing=False):
+    if absoluteIndexing:
+      i = self.features.firstOrder[index]
+    else:
+      i = self.features.firstIndex[index]
     
     # Are we progressing up the scale or down?
     if self.settings['direction'] == 'up':
@@ -289,8 +447,25 @@ class PoemParser():
       return (startnote-i)%self.settings['range']+self.settings['offset']
 
 
+  # `getNoteIndex` for every token at once.
+  def noteColumn(self, startnote, absoluteIndexing=False):
+    if absoluteIndexing:
+      order = self.features.firstOrder
+    else:
+      order = self.features.firstIndex
+    range, offset = self.settings['range'], self.settings['offset']
+    if self.settings['direction'] == 'up':
+      return [(startnote+i)%range+offset for i in order]
+    return [(startnote-i)%range+offset for i in order]
+
+
   # Music Generation Algorithms
   # ---------------------------
+  #
+  # Each algorithm decides how the word at token `index` is played -
+  # `(channel, velocity, delta, off)`, see `midirender` - independently
+  # of the note it is played on, so one decision serves every file of a
+  # render.
 
   def getAlgoFunc(self, algo):
     return {
@@ -304,212 +479,304 @@ class PoemParser():
 
 
   # **Algorithm 1**
-  def __algo1(self, index, word, lastfullword, startnote, just_index=False):
-    noteindex = self.getNoteIndex(None, word, startnote)
-
-    if just_index:
-      return noteindex
-
-    self.midi.note_on(index%self.settings['numchannels'], noteindex, self.settings['loudness'])
-    self.midi.update_time(int(random()*self.settings['randdist']+self.settings['randoffset']))
-
-    return noteindex
+  def __algo1(self, index, count=0):
+    return (index%self.settings['numchannels'], self.settings['loudness'],
+            int(random()*self.settings['randdist']+self.settings['randoffset']), HOLD)
 
 
   # **Algorithm 2**
-  def __algo2(self, index, word, lastfullword, startnote, just_index=False):
-    noteindex = self.getNoteIndex(None, word, startnote)
-    if just_index:
-      return noteindex
-    
-    extratime = self.addTimeForSentenceEnd(lastfullword)
-      
-    self.midi.note_on(index%(self.settings['numchannels']), noteindex, self.settings['loudness'])
-    self.midi.update_time(int(random()*self.settings['randdist']+self.settings['randoffset']+extratime))
-    
+  def __algo2(self, index, count=0):
+    extratime = self.addTimeForSentenceEnd(index)
+    delta = int(random()*self.settings['randdist']+self.settings['randoffset']+extratime)
+    off = HOLD
+
     # *Short notes*
     if self.settings['truncate'] == 1:
-      self.midi.note_off(index%self.settings['numchannels'], noteindex)
+      off = OFF
       
     # *Short and long notes*
     if self.settings['truncate'] == 2:
       if random() < .5:
-        self.midi.note_off(index%self.settings['numchannels'], noteindex)
+        off = OFF
 
-    return noteindex
+    return (index%(self.settings['numchannels']), self.settings['loudness'], delta, off)
 
 
   # **Algorithm 3**
-  def __algo3(self, index, word, lastfullword, startnote, count=0, just_index=False):
-    noteindex = self.getNoteIndex(None, word, startnote)
-    if just_index:
-      return noteindex
-    
-    extratime = self.addTimeForSentenceEnd(lastfullword) + \
-                self.addTimeForSentencePause(lastfullword) + \
-                self.addTimeForSyllables(word)    
+  def __algo3(self, index, count=0):
+    extratime = self.addTimeForSentenceEnd(index) + \
+                self.addTimeForSentencePause(index) + \
+                self.addTimeForSyllables(index)    
     loudness =  self.addLoudnessForCount(count)
+    delta = int(random()*self.settings['randdist']+self.settings['randoffset']+extratime)
+    off = HOLD
 
-    self.midi.note_on(index%(self.settings['numchannels']), noteindex, loudness)
-    self.midi.update_time(int(random()*self.settings['randdist']+self.settings['randoffset']+extratime))
-    
     # *Short and long based on index*
     if self.settings['truncate']:
       if (count % self.settings['truncate']):      
-        self.midi.note_off(index%self.settings['numchannels'], noteindex)
-        self.midi.update_time(0)
-    return noteindex
+        off = OFF_RESET
+    return (index%(self.settings['numchannels']), loudness, delta, off)
 
 
   # **Algorithm 4 base**
-  def __algo4_base(self, index, word, lastfullword, startnote, noteindex, count=0, just_index=False): 
+  #
+  # `punctuation=False` ignores sentence ends and pauses (algorithm 5).
+  def __algo4_base(self, index, count=0, punctuation=True): 
     extratime = 0
     extraloud = 0    
-    try:
-      extratime = self.addTimeForSentenceEnd(lastfullword)
+    if punctuation:
+      extratime = self.addTimeForSentenceEnd(index)
       if extratime > 0:
         extraloud = 15
         self.lastspeed = int(random()*self.settings['randdist']+self.settings['randoffset'])        
 
-      extratime = self.addTimeForSentencePause(lastfullword, 150, 100)
+      extratime = self.addTimeForSentencePause(index, 150, 100)
       if extratime > 0:
         extraloud = 10
         self.lastspeed = int(random()*self.settings['randdist']+self.settings['randoffset'])
-    except:
-      pass      
-    extratime += self.addTimeForSyllables(word) + \
+    extratime += self.addTimeForSyllables(index) + \
                  self.addTimeToHumanize()
     loudness   = self.addLoudnessForCount(count, extraloud)
 
     if loudness > 255:
       loudness = 255
 
-    self.midi.note_on(index%(self.settings['numchannels']), noteindex, loudness)
-    self.midi.update_time(self.lastspeed+extratime)
+    off = HOLD
 
     # *Short and long based on index*
     if self.settings['truncate']:
       if (count % self.settings['truncate']):      
-        self.midi.note_off(index%self.settings['numchannels'], noteindex)
-        self.midi.update_time(0)
-    return noteindex
+        off = OFF_RESET
+    return (index%(self.settings['numchannels']), loudness, self.lastspeed+extratime, off)
 
 
 
   # **Algorithm 4**
-  def __algo4(self, index, word, lastfullword, startnote, count=0, just_index=False):    
-    noteindex = self.getNoteIndex(None, word, startnote)
-    if just_index:
-      return noteindex
-    return self.__algo4_base(index, word, lastfullword, startnote, noteindex, count, just_index)
+  def __algo4(self, index, count=0):    
+    return self.__algo4_base(index, count)
 
 
 
   # **Algorithm 5**
-  def __algo5(self, index, word, lastfullword, startnote, count=0, just_index=False):    
-    return self.__algo4(index, word, None, startnote, count=0, just_index=False)
+  def __algo5(self, index, count=0):    
+    return self.__algo4_base(index, 0, False)
     
     
 
   # **Algorithm 7**
-  def __algo7(self, index, word, lastfullword, startnote, count=0, just_index=False):    
-    noteindex = self.getNoteIndex(1, word, startnote)
-    if just_index:
-      return noteindex
-    return self.__algo4_base(index, word, lastfullword, startnote, noteindex, count, just_index)
+  def __algo7(self, index, count=0):    
+    return self.__algo4_base(index, count)
 
 
   # MIDI Generation
   # ---------------
 
-  # Initialize the MIDI generator, creating the output MIDI file and header info.
-  def __midistart(self, filename, tempo=250000):
-    dir = "%s/%s/songs"%(self.basedir, self.dataset)
-    if not os.path.exists(dir):
-      os.makedirs(dir)
-
+  # Returns the path of the MIDI file `filename` for the current settings.
+  def midiPath(self, filename):
+    dir  = "%s/%s/songs"%(self.basedir, self.dataset)
     name = self.settings['name']
     algo = self.settings['algo']
-    self.midiindex = 0
-    self.midiwordinfo = {}
-    self.midiwordinfo['_firsttime'] = True
-    self.midi = MidiOutFile("%s/a%s_%s_%s"%(dir, algo, name.replace(' ','_'), filename))
-    self.debug("Creating MIDI file ------------------")
-    self.midi.header()
-    self.midi.start_of_track() 
-    self.midi.tempo(tempo)
-    self.midi.time_signature(4, 2, 24, 8)
-
-
-  # Outputs the next MIDI note for the current word.   
-  def __midiadd(self, index, word, lastfullword, startnote=0, absoluteIndexing=False):
-    try:
-      if self.midiwordinfo[word][0] > 0:    
-        pass
-        
-    except:
-      self.midiindex += 1
-      self.midiwordinfo[word] = {}
-      self.midiwordinfo[word][0] = 0
-      
-      if absoluteIndexing:
-        self.midiwordinfo[word][1] = self.midiindex
-      else:
-        self.midiwordinfo[word][1] = index+1 
+    return "%s/a%s_%s_%s"%(dir, algo, name.replace(' ','_'), filename)
 
-    if not startnote:
-      startnote = self.settings['startnote']
 
-    self.midiwordinfo[word][0] += 1
+  # Logs the note(s) played for the word at token `index`.
+  def __midilog(self, index, notes):
+    # Only verbose runs pay for the tagger here.
+    if not args['verbose']:
+      return
 
-    # This is where the real logic lies, in the various alorithms that determine the
-    # individuality of this note/musical phrase.
-    noteindex = self.getAlgoFunc(self.settings['algo'])(index, word, 
-        lastfullword, startnote, self.midiwordinfo[word][0])
-    
-    if self.midiwordinfo['_firsttime']:
-      self.debug("poemparser:__midiadd %s %s . %s . %s . %s . %s\n" %
-        ("word" .rjust(30),
-         "idx"  .rjust(4),
-         "cnt"  .rjust(3),
-         "midi" .rjust(4),
-         "pos"  .rjust(5),
-         "syl"  .rjust(3)), '')
-      self.midiwordinfo['_firsttime'] = 0
-    
+    f = self.features
     self.debug("poemparser:__midiadd %s %s . %s . %s . %s . %s" %
-      (("%s" % word)                        .rjust(30),
+      (("%s" % f.token[index])              .rjust(30),
        ("%s" % index)                       .rjust(4),
-       ("%s" % self.midiwordinfo[word][0])  .rjust(3),
-       ("%s" % noteindex)                   .rjust(4),
-       ("%s" % self.pos_tag_iter.next())    .rjust(5),
-       ("%s" % self.numsyl(word))           .rjust(3)), '')
-  
+       ("%s" % f.count[index])              .rjust(3),
+       ("%s" % "/".join(["%s" % n for n in notes])).rjust(4),
+       ("%s" % f.pos[index])                .rjust(5),
+       ("%s" % f.numsyl[index])             .rjust(3)), '')
+
+
+  # Renders `files` - `(filename, startnote, absoluteIndexing)` triples -
+  # in a single pass over the tokens: each token's timing and loudness
+  # are decided once and written to every file with that file's note.
+  def createMIDIFiles(self, files, tempo=250000):
+    targets = []
+    for filename, startnote, absoluteIndexing in files:
+      self.debug("poemparser:createMIDIFile:filename %s"%filename)
+      if not self.isOutputCurrent(self.midiPath(filename), startnote, tempo, absoluteIndexing,
+                                  'pass', args['vectorized']):
+        targets.append((filename, startnote or self.settings['startnote'], absoluteIndexing))
+    if not targets:
+      return
+
+    with self.profiler.stage('createMIDIFiles:%s' % len(targets)):
+      self.renderMIDIFiles(targets, tempo)
+
+
+  # Renders `files` - `(filename, startnote, absoluteIndexing)` triples,
+  # with `startnote` resolved - for the current settings, whether or not
+  # they are up to date. `tempo` is in microseconds per beat.
+  def renderMIDIFiles(self, files, tempo=250000):
+    self.debug("Creating MIDI files ------------------")
+    targets = [MidiTarget(self.midiPath(filename), startnote, absoluteIndexing, tempo)
+               for filename, startnote, absoluteIndexing in files]
+    render  = MidiRender(targets)
+    columns = [self.noteColumn(target.startnote, target.absoluteIndexing) for target in targets]
+
+    self.debug("poemparser:__midiadd %s %s . %s . %s . %s . %s\n" %
+      ("word" .rjust(30),
+       "idx"  .rjust(4),
+       "cnt"  .rjust(3),
+       "midi" .rjust(4),
+       "pos"  .rjust(5),
+       "syl"  .rjust(3)), '')
+
+    # With `--vectorized`, every decision is made up front as arrays.
+    if args['vectorized']:
+      self.renderVectorized(render, targets)
+      return
+
+    # This is where the real logic lies, in the various alorithms that determine the
+    # individuality of this note/musical phrase.
+    decide = self.getAlgoFunc(self.settings['algo'])
+    count  = self.features.count
+    for i in xrange(len(self.features)):
+      notes = [column[i] for column in columns]
+      render.emit(notes, decide(i, count[i]))
+      self.__midilog(i, notes)
+
+    render.close()
+
+
+  # The `--vectorized` render: the notes and decisions of all tokens as
+  # NumPy arrays, with the jitter drawn from a generator seeded from
+  # `random`, so a seeded render job stays reproducible. The NumPy
+  # versions of the music algorithms are only imported here, so runs
+  # without `--vectorized` never load NumPy.
+  def renderVectorized(self, render, targets):
+    from vectorized import noteArray, decisionArrays, randomState
+    f = self.features
+    columns = [noteArray(f.firstOrder if target.absoluteIndexing else f.firstIndex,
+                         target.startnote, self.settings).tolist() for target in targets]
+    rng = randomState(randint(0, 2**32-1))
+    channel, velocity, delta, off, self.lastspeed = \
+      decisionArrays(f, self.settings, rng, self.lastspeed)
+    render.emitAll(columns, zip(channel.tolist(), velocity.tolist(), delta.tolist(), off.tolist()))
+
+    if args['verbose']:
+      for i, notes in enumerate(zip(*columns)):
+        self.__midilog(i, notes)
+    render.close()
 
-  # Finalize the MIDI generation.
-  def __midiend(self):
-    self.midi.update_time(0)
-    self.midi.end_of_track()
-    self.midi.eof()
+
+  #
+  def createMIDIFile(self, filename, startnote, tempo=250000, absoluteIndexing=False):
+    self.createMIDIFiles([(filename, startnote, absoluteIndexing)], tempo)
+
+
+  # Renders `jobs` - `(settings version, filename, startnote,
+  # absoluteIndexing)` - one file per job, in a pool of `processes`
+  # workers. The pool is forked once the tokens are analyzed, so workers
+  # share them rather than reading and tagging again. Each job is seeded
+  # from its dataset, settings version and filename (`renderSeed`), so a
+  # file is the same whatever the number of workers and the order they
+  # finish in. Returns `(version, filename, seconds)` per rendered job.
+  def scheduleMIDIRenders(self, jobs, tempo=250000, processes=1):
+    global _renderParser
+    settings = self.settings
+    pending  = []
+    for version, filename, startnote, absoluteIndexing in jobs:
+      self.setMIDISettings(version)
+      self.debug("poemparser:createMIDIFile:filename %s"%filename)
+      if not self.isOutputCurrent(self.midiPath(filename), startnote, tempo, absoluteIndexing,
+                                  'jobs', args['vectorized']):
+        pending.append((version, filename, startnote or self.settings['startnote'], absoluteIndexing,
+                        tempo, renderSeed(self.dataset, version, filename)))
+    self.settings = settings
+    if not pending:
+      return []
+
+    # Everything the renders read is computed before the pool forks.
+    self.features
+    if args['verbose']:
+      self.features.pos
+
+    _renderParser = self
+    pool = None
+    if processes > 1 and len(pending) > 1 and not multiprocessing.current_process().daemon:
+      pool = multiprocessing.Pool(min(processes, len(pending)))
+    try:
+      with self.profiler.stage('scheduleMIDIRenders:%s' % len(pending)):
+        if pool:
+          results = pool.map(_renderJob, pending, 1)
+        else:
+          results = map(_renderJob, pending)
+    finally:
+      if pool:
+        pool.close()
+        pool.join()
+      _renderParser = None
+      self.settings  = settings
+
+    for version, filename, seconds in results:
+      self.profiler.add('render:v%s:%s' % (version, filename), seconds)
+      self.debug("poemparser:render v%s %s %.3fs" % (version, filename, seconds), '')
+    return results
 
 
   # NLTK Parsing and Analysis
   # -------------------------
 
   def is_english_word(self,   word):
-    return word.lower() in self.english_words
+    return self.lexicon.isEnglish(word)
   
   #
   def openTokens(self, filename):
     words = open(filename).read()
 
-    # This is a clunky and kludgy data cleaning step; however, it really 
-    # depends upon the source material, so I just put in some default 
-    # logic that should work in most cases.
-    tokenizedWords = WhitespaceTokenizer().tokenize(words)
-    sanitizedWords = []
-    replacedWords  = []
-    for word in tokenizedWords:
+    # Lines are cleaned independently, so a line seen before (earlier in
+    # this poem, or in the previous `--incremental` run) is not redone.
+    sanitizedWords  = []
+    replacedWords   = []
+    wordLines       = []
+    self.lineHashes = []
+    for lineno, line in enumerate(words.splitlines()):
+      key = lineHash(line)
+      self.lineHashes.append(key)
+      cleaned = self.lineTokens.get(key)
+      if cleaned is None:
+        cleaned = self.lineTokens[key] = self.cleanTokens(self.backend.tokenize(line))
+
+      for word, rword, lword in cleaned:
+        sanitizedWords.append(word)
+        replacedWords.append(rword)
+        wordLines.append(lineno)
+
+        if not self.is_english_word(rword):
+          index = lword or rword
+          # Ignore contractions.
+          if rword.find('\'') != -1:
+            try:
+              self.iffyWords[index] += 1
+            except:
+              self.iffyWords[index]  = 1
+          else:
+            try:
+              self.unknownWords[index] += 1
+            except:
+              self.unknownWords[index ] = 1
+          
+    return [sanitizedWords, replacedWords, words.split(), wordLines]
+
+
+  # Cleans the whitespace-separated `tokens` of one line, returning a
+  # `(word, rword, lword)` triple per non-empty word: the sanitized word,
+  # its replacement (`*in'` -> `*ing`) and the original `*in'` spelling.
+  def cleanTokens(self, tokens):
+    ret = []
+    for word in tokens:
+      # This is a clunky and kludgy data cleaning step; however, it really 
+      # depends upon the source material, so I just put in some default 
+      # logic that should work in most cases.
       self.debug("ORIGINAL WORD %s"%word, '')
 
       str   = u'[().,!;?"]'
@@ -551,147 +818,290 @@ class PoemParser():
           word = reg.sub('', word)
 
       if word != '':
-        sanitizedWords.append(word)
-        replacedWords.append(rword)
-
-        if not self.is_english_word(rword):
-          index = lword or rword
-          # Ignore contractions.
-          if rword.find('\'') != -1:
-            try:
-              self.iffyWords[index] += 1
-            except:
-              self.iffyWords[index]  = 1
-          else:
-            try:
-              self.unknownWords[index] += 1
-            except:
-              self.unknownWords[index ] = 1
-          
-    return [sanitizedWords, replacedWords, words.split()]
+        ret.append((word, rword, lword))
+    return ret
 
 
 
   # Returns the number of syllables in the word.
   def numsyl(self, word): 
-    try:
-      return [len(list(y for y in x if isdigit(y[-1]))) for x in self.dict[word.lower()]]
-    except:
-      return [0]
+    return self.lexicon.numsyl(word)
 
 
+  # Returns `(syllables, stress, primary)` for the word's first
+  # pronunciation, e.g. `(3, '102', 0)` for "yesterday".
+  def phonetics(self, word):
+    return self.lexicon.phonetics(word)
 
-  # Returns all nGrams of length `len`.
+
+
+  # Returns all nGrams of length `len`. Every occurrence of one that
+  # repeats is recorded in `ngramStarts` as it is counted.
   def ngramFinder(self, len):
     match = {}
+    first = {}
+    starts = self.ngramStarts
 
-    for n in ngrams(self.loweredTokens, len):    
+    for i, n in enumerate(self.backend.ngrams(self.loweredTokens, len)):
       a = tuple(n)
       self.debug(a)
       try:
-        self.allmatch[a] = match[a] = match[a]+1
+        match[a] = match[a]+1
       except:
-        self.allmatch[a] = match[a] = 1
+        match[a] = 1
+        first[a] = i
+        continue
+      if match[a] == 2:
+        starts[a] = [first[a], i]
+      else:
+        starts[a].append(i)
 
-    for s in sorted(match.keys(), key=lambda m: match[m], reverse=True):
-      if match[s] > 1:
-        self.debug("poemparser:ngramFinder %s : %s"%(match[s], s), '')
+    # Each length is only counted once, so its counts are final here.
+    self.allmatch.update(match)
+
+    if args['verbose']:
+      for s in sorted(match.keys(), key=lambda m: match[m], reverse=True):
+        if match[s] > 1:
+          self.debug("poemparser:ngramFinder %s : %s"%(match[s], s), '')
 
     return match
 
 
 
-  # Ideally, this method would find all rhymes, although I am not 100%
-  # sure how to tackle this one yet... saving for later.
+  # Groups the poem's vocabulary by rhyme: returns `(key, words)` for
+  # every rhyme key shared by at least two distinct words, in order of
+  # first occurrence. Each word is one lookup in the lexicon index, whose
+  # rhyme keys are computed from cmudict when the index is built.
   # See [this paper](http://www.mit.edu/~6.863/spring2011/nltk/ch2-3.pdf) for more details.
   def rhymeFinder(self):
-    tokenHash = {}
-    for word in self.tokens:
-      tokenHash[word] = None
-
-    entries = nltk.corpus.cmudict.entries()
-    for word in entries:
-      if tokenHash[word[0]]:
-        tokenHash[word[0]] = word[1]
-
-
-
-  # Utilizes NLTK's pseudo-text generation ability to create text in 
-  # a similar style as the source text.
-  def generatePseudoText(self, textlen=100):
+    groups = {}
+    order  = []
+    seen   = set()
+    for word in self.loweredTokens:
+      if word in seen:
+        continue
+      seen.add(word)
+      code = self.lexicon.rhymeCode(word)
+      if not code:
+        continue
+      if code not in groups:
+        groups[code] = []
+        order.append(code)
+      groups[code].append(word)
+
+    return [(self.lexicon.rhymeName(code), groups[code]) for code in order
+            if len(groups[code]) > 1]
+
+
+
+  # Generates `count` texts in a similar style as the source text, from
+  # a trigram model of it; text `i` is generated with seed `seed + i`.
+  def generatePseudoText(self, textlen=100, count=1, seed=42):
     self.debug("poemparser:generatePseudoText \n")
-    self.text.generate(textlen)
+    texts = self.markov.generateMany(count, textlen, seed)
+    for text in texts:
+      print text
+    return texts
 
 
 
   # Generate a JSON data file containing the statistics for the words
   # in the source file. Will be consumed by JS-visualization programs.
   def generateJSON(self, startnote, varname=None):
-    self.pos_tag_iter = (pos for (w, pos) in self.pos_tags)
-
     if not varname:
       varname = self.dataset
 
-    js = ''
-    found = 0
-    lastfullword = None
-    self.midiwordinfo = {}
+    dir = "%s/%s/javascript" % (self.basedir, self.dataset)
+    # The token table carries POS tags, so it also depends on the tagger
+    # (whose signature is only worth asking for with `--incremental`).
+    current = [self.state is not None and
+               self.isOutputCurrent("%s/%s.json" % (dir, self.dataset), startnote,
+                                    self.backend.taggerSignature())]
+    for name in ("ngrams", "ngram_positions"):
+      current.append(self.isOutputCurrent("%s/%s_%s.json" % (dir, self.dataset, name),
+                                          args['maxNgram'], args['ngrams']))
+    if all(current):
+      return
 
-    for i, word in enumerate(self.parsedTokens):
-      try:
-        mwi = self.midiwordinfo[word]
-        if mwi[0] > 0:    
-          pass
-      except:     
-        found += 1
-        mwi = self.midiwordinfo[word] = {}
-        mwi[0] = 0
-        mwi[1] = found
-        
-      noteindex = self.getAlgoFunc(self.settings['algo'])(i, word, lastfullword, startnote, mwi[0], True)
-      mwi[0] += 1
-      js += ('{"word": "%s", "rword": "%s", "fullword": "%s", "index": "%s", "count": "%s", "wordindex": "%s",\
-               "noteindex": "%s", "numsyl": "%s", "pos": "%s"},\n' %
-        (self.parsedTokens[i], self.replacedTokens[i], self.fullTokens[i].replace("\"","\\\""), mwi[1]+1, mwi[0], i+1,
-         noteindex, self.numsyl(word)[0], self.pos_tag_iter.next()))
+    f = self.features
 
-      lastfullword = word
+    js = ''
+    for i in xrange(len(f)):
+      noteindex = self.getNoteIndex(i, startnote, True)
+      js += ('{"word": "%s", "rword": "%s", "fullword": "%s", "index": "%s", "count": "%s", "wordindex": "%s",\
+               "noteindex": "%s", "numsyl": "%s", "stress": "%s", "primarystress": "%s", "pos": "%s"},\n' %
+        (f.token[i], f.rtoken[i], f.fulltoken[i].replace("\"","\\\""), f.firstOrder[i]+1, f.count[i], i+1,
+         noteindex, f.numsyl[i], f.stress(i), f.primaryStress(i), f.pos[i]))
 
     js = '[\n%s\n]'%(js[:-2])
     self.debug("poemparser:generateJSON \n%s\n"%js)    
     self.dumpfile('javascript', "%s.json"%self.dataset, js)
     
-    ngramJSON = '[\n%s\n]' % self.printSortedNgrams(True)
+    ngrams = self.sortedNgrams()
+    ngramJSON = '[\n%s\n]' % self.printSortedNgrams(True, ngrams)
     self.dumpfile('javascript', "%s_ngrams.json"%self.dataset, ngramJSON)
 
+    positionsJSON = '[\n%s\n]' % self.printNgramPositions(ngrams)
+    self.dumpfile('javascript', "%s_ngram_positions.json"%self.dataset, positionsJSON)
+
     return js
 
 
 
+  # Writes the rhyme groups of the vocabulary to `_rhymes.json`.
+  def generateRhymeJSON(self):
+    path = "%s/%s/javascript/%s_rhymes.json" % (self.basedir, self.dataset, self.dataset)
+    if self.isOutputCurrent(path):
+      return
+
+    js = ''
+    for key, words in self.rhymeFinder():
+      self.debug("poemparser:rhymeFinder %s : %s" % (key, words), '')
+      js += '{"rhyme": "%s", "words": [%s]},\n' % (key, ", ".join(["\"%s\"" % w for w in words]))
+
+    js = '[\n%s\n]' % js[:-2]
+    self.dumpfile('javascript', "%s_rhymes.json" % self.dataset, js)
+    return js
+
+
+
+  # The n-gram lengths reported: 2 up to `--max-ngram` (0 for no limit).
+  def ngramRange(self):
+    return range(2, (args['maxNgram'] or len(self.loweredTokens)) + 1)
+
+
+  # Identifies how `allmatch` is counted, for `--incremental` reruns.
+  def ngramKey(self):
+    return (args['ngramEngine'], args['maxNgram'])
+
+
+  # Where every word occurs, for concordance lines.
+  @lazyproperty
+  def concordance(self):
+    with self.profiler.stage('concordanceIndex'):
+      return ConcordanceIndex(self.tokens)
+
+
+  # The lowered tokens as integer IDs, and the vocabulary they index.
+  @lazyproperty
+  def tokenIds(self):
+    return internTokens(self.loweredTokens)
+
+
+  # Suffix array over the lowered tokens; finds every repeated n-gram in
+  # a single pass.
+  @lazyproperty
+  def repeatIndex(self):
+    with self.profiler.stage('repeatIndex'):
+      return RepeatIndex(self.loweredTokens, self.tokenIds)
+
+
   #
   def printAllNgrams(self):
-    for n in range(2, 20):
+    # One walk over the suffix array finds the repeats of every length;
+    # `allmatch` then holds only n-grams that occur more than once.
+    if args['ngramEngine'] == 'suffix':
+      self.ngramStarts = {}
+      self.allmatch = RankedCounts(self.repeatIndex.counts(2, args['maxNgram'] or None, self.ngramStarts))
+      self.printSortedNgrams()
+      return
+
+    # Same result, counted with NumPy rolling hashes one length at a time.
+    if args['ngramEngine'] == 'hash':
+      self.ngramStarts = {}
+      self.allmatch = RankedCounts(hashCounts(self.loweredTokens, 2, args['maxNgram'] or None, self.tokenIds,
+                                              self.ngramStarts))
+      self.printSortedNgrams()
+      return
+
+    # Bounded memory: sketch, spill to disk, merge.
+    if args['ngramEngine'] == 'stream':
+      counter = StreamCounter(args['memoryBudget'] * 1024 * 1024)
+      self.allmatch = RankedCounts(counter.counts(self.loweredTokens, 2, args['maxNgram'] or None))
+      self.ngramStats = {'distinct':counter.distinct, 'spills':counter.spills}
+      for n, distinct in sorted(counter.distinct.items()):
+        self.debug("poemparser:printAllNgrams %s-grams: ~%s distinct" % (n, distinct), '')
+      self.printSortedNgrams()
+      return
+
+    # The dict engine's counts as map/reduce over `--ngram-jobs` processes.
+    if args['ngramEngine'] == 'parallel':
+      self.allmatch = RankedCounts(parallelCounts(self.loweredTokens, args['ngramJobs'], 2,
+                                                  args['maxNgram'] or None, self.tokenIds))
+      self.printSortedNgrams()
+      return
+
+    # Patch the previous run's counts rather than recounting everything.
+    if self.changes is not None and self.state.previous['ngramKey'] == self.ngramKey():
+      previous = self.state.previous
+      self.allmatch = updateNgramCounts(previous['allmatch'], previous['loweredTokens'],
+                                        self.loweredTokens, self.changes, self.ngramRange())
+      self.printSortedNgrams()
+      return
+
+    self.ngramStarts = {}
+    for n in self.ngramRange():
       self.debug("poemparser:printAllNgrams ----------------- %s ----------------\n"%n)
       ng = self.ngramFinder(n)
-      self.printSortedNgrams()
+    self.printSortedNgrams()
 
 
-  #
-  def printSortedNgrams(self, returnJSON=False):
+  # The repeats `--ngrams closed` or `--ngrams maximal` keeps, found on
+  # the suffix array; None keeps them all.
+  @lazyproperty
+  def keptNgrams(self):
+    if args['ngrams'] == 'all':
+      return None
+    tokens = self.loweredTokens
+    return set(tuple(tokens[start:start+n]) for start, n in
+               self.repeatIndex.select(args['ngrams'], 2, args['maxNgram'] or None))
+
+
+  # The reported n-grams, most frequent first (ties in n-gram order).
+  def sortedNgrams(self):
+    kept = self.keptNgrams
+    return [s for s in self.allmatch.repeats() if kept is None or s in kept]
+
+
+  # Prints the reported n-grams (with `-v`), or returns them as JSON rows.
+  def printSortedNgrams(self, returnJSON=False, ngrams=None):
+    if not returnJSON and not args['verbose']:
+      return ''
     ret = ''
-    for s in sorted(self.allmatch.keys(), key=lambda m: self.allmatch[m], reverse=True):
-      if self.allmatch[s] > 1:
-        if returnJSON:
-          words = ", ".join(["\"%s\"" % w for w in s])
-          ret += "{\"count\":%s,\"words\" : [%s]},\n" % (self.allmatch[s], words)
-        else:
-          self.debug("poemparser:printAllNgrams %s : %s"%(self.allmatch[s], s), '')
+    for s in ngrams or self.sortedNgrams():
+      if returnJSON:
+        words = ", ".join(["\"%s\"" % w for w in s])
+        ret += "{\"count\":%s,\"words\" : [%s]},\n" % (self.allmatch[s], words)
+      else:
+        self.debug("poemparser:printAllNgrams %s : %s"%(self.allmatch[s], s), '')
     return ret[:-2]
 
 
+  # Where each n-gram of `_ngrams.json` occurs, in the same order: its
+  # `wordindex` values, delta-encoded, so the visualization can highlight
+  # a phrase without scanning the tokens. The dict, suffix and hash
+  # engines record the positions while counting; for the others (which
+  # keep only counts) they are found in one more pass over the tokens.
+  def printNgramPositions(self, ngrams=None):
+    ngrams = ngrams or self.sortedNgrams()
+    positions = self.ngramStarts
+    if positions is None:
+      positions = ngramPositions(self.loweredTokens, ngrams)
+    return ",\n".join(["[%s]" % ",".join(["%s" % d for d in deltaEncode([i+1 for i in positions[s]])])
+                       for s in ngrams])
+
+
   #
   def printAllConcordance(self):
-    for word in sorted(set(self.tokens).difference([".", ",", "!", "?", ";", ":", "-"])):
+    words = set(self.tokens).difference([".", ",", "!", "?", ";", ":", "-"])
+
+    # Only words near an edit (within `get_concordance`'s default context)
+    # can have new concordance lines.
+    if self.changes is not None:
+      affected = affectedWords(self.state.previous['tokens'], self.tokens, self.changes, 75/4)
+      words = [word for word in words if word.lower() in affected]
+
+    for word in sorted(words):
       cc = self.get_concordance(word)
       self.debug("poemparser:printAllConcordance ----------------- %s ----------------\n%s\n"%(word,cc))
       if args['concord']:
@@ -699,33 +1109,17 @@ class PoemParser():
 
 
 
-  # Pretty-parsing for concordance output.
-  def get_concordance(self, word, width=75, lines=25): 
-    half_width = (width - len(word) - 2) / 2 
-    # Approximate number of words of context.
-    context = width/4 
-    ret = ''
-    self.text.concordance(word)
-
-    offsets = self.text._concordance_index.offsets(word) 
-    if offsets: 
-      lines = min(lines, len(offsets)) 
-
-      for i in offsets: 
-        if lines <= 0: 
-          break 
-
-        left  = (' ' * half_width + ' '.join(self.text._concordance_index._tokens[i-context:i])) 
-        right = ' '.join(self.text._concordance_index._tokens[i+1:i+context]) 
-        left  = left[-half_width:] 
-        right = right[:half_width] 
-        ret  += "%s  %s  %s\n"%(left, word, right)
+  # Saves the concordance index, so `concordance.py` can answer queries
+  # for this dataset without the per-word files.
+  def saveConcordance(self):
+    path = concordancePath(self.basedir, self.dataset)
+    if not self.isOutputCurrent(path):
+      self.concordance.save(path)
 
-        lines -= 1 
 
-    else: 
-      pass  
-    return ret
+  # Pretty-parsing for concordance output.
+  def get_concordance(self, word, width=75, lines=25): 
+    return self.concordance.lines(word, width, lines)
 
 
   # Create/open/dump data.
@@ -744,27 +1138,254 @@ class PoemParser():
       print "%s%s"%(prefix,msg)
 
 
+# Shared resources
+# ----------------
+
+# Linguistic resources that are loaded once per process and shared by
+# every `PoemParser` created in it (the lexicon index and the backends,
+# with their taggers, are shared the same way by `openLexicon` and
+# `getBackend`).
+_resources = {}
+
+# Returns the process-wide POS tag cache for `tagger` stored under `basedir`.
+def sharedTagCache(basedir, tagger):
+  path  = "%s/.cache/postags.pickle" % basedir
+  model = modelSignature(tagger)
+  cache = _resources.get((path, model))
+  if cache is None:
+    cache = _resources[(path, model)] = TagCache(path, model)
+  return cache
+
+
+# Loads everything a full `runAll` needs up front, so a batch pays for it
+# once rather than once per dataset.
+def preloadResources(basedir="parsed_data"):
+  backend = getBackend(args['backend'])
+  openLexicon()
+  backend.preload()
+  sharedTagCache(basedir, backend.tagger())
+
+
+
+# Batch processing
+# ----------------
+
+# Returns the names of all datasets under `basedir`, i.e. every directory
+# with a `source/<name>` file.
+def listDatasets(basedir="parsed_data"):
+  ret = []
+  for name in sorted(os.listdir(basedir)):
+    if os.path.isfile("%s/%s/source/%s" % (basedir, name, name)):
+      ret.append(name)
+  return ret
+
+
+# Expands dataset names and glob patterns (e.g. `'g*'`) against the
+# datasets under `basedir`, keeping the order they were given in.
+def resolveDatasets(patterns, basedir="parsed_data"):
+  available = listDatasets(basedir)
+  ret = []
+  for pattern in patterns:
+    matches = fnmatch.filter(available, pattern) or [pattern]
+    for name in matches:
+      if name not in ret:
+        ret.append(name)
+  return ret
+
+
+# Runs the full pipeline for one dataset and returns `(name, status,
+# seconds, tokens)`; a failure is reported rather than raised so a batch
+# can go on. `tokens` are the lowered tokens with `--index`, so the
+# corpus index doesn't parse the dataset again, and None otherwise.
+def runDataset(name, basedir="parsed_data"):
+  start = time.time()
+  tokens = None
+  try:
+    pp = PoemParser(dataset=name, basedir=basedir)
+    pp.runAll()
+    if args['index']:
+      tokens = pp.loweredTokens
+    status = 'ok'
+  except Exception, err:
+    traceback.print_exc()
+    status = 'FAILED (%s: %s)' % (err.__class__.__name__, err)
+  return (name, status, time.time() - start, tokens)
+
+
+# The parser whose files `_renderJob` renders; set before a render pool
+# is forked, so its workers inherit it.
+_renderParser = None
+
+# Renders one `scheduleMIDIRenders` job; returns `(version, filename,
+# seconds)`.
+def _renderJob(job):
+  version, filename, startnote, absoluteIndexing, tempo, jobseed = job
+  start = time.time()
+  parser = _renderParser
+  parser.setMIDISettings(version)
+  parser.lastspeed = 0
+  seed(jobseed)
+  parser.renderMIDIFiles([(filename, startnote, absoluteIndexing)], tempo)
+  return (version, filename, time.time() - start)
+
+
+# The random seed of a render job: a CRC of what identifies its file.
+def renderSeed(dataset, version, filename):
+  return zlib.crc32("%s:%s:%s" % (dataset, version, filename)) & 0xffffffff
+
+
+#
+def _runDatasetJob(job):
+  return runDataset(*job)
+
+
+# Runs every dataset in `names`, reusing one warm set of linguistic
+# resources, and returns the per-dataset results in the order given.
+#
+# With `jobs > 1` the resources are loaded in this process before a pool
+# of `jobs` workers is forked, so the tagger and the mapped lexicon are
+# shared copy-on-write rather than loaded again per worker. Datasets are
+# handed out one at a time so long poems don't hold up a whole share.
+def runBatch(names, basedir="parsed_data", jobs=1):
+  preloadResources(basedir)
+  if jobs > 1 and len(names) > 1:
+    pool = multiprocessing.Pool(min(jobs, len(names)))
+    try:
+      return pool.map(_runDatasetJob, [(name, basedir) for name in names], 1)
+    finally:
+      pool.close()
+      pool.join()
+
+  results = []
+  for name in names:
+    print "poemparser:batch %s..." % name
+    results.append(runDataset(name, basedir))
+  return results
+
+
+# Re-indexes the datasets in `names` whose source changed since they were
+# last added to the corpus index; `tokens` maps each name to the lowered
+# tokens its run produced.
+def indexDatasets(names, tokens, basedir="parsed_data"):
+  updated = updateCorpusIndex(basedir, names, tokens.get)
+  print "poemparser:index %s of %s datasets re-indexed" % (len(updated), len(names))
+
+
+#
+def printBatchSummary(results, elapsed):
+  width = max([len(r[0]) for r in results] + [7])
+  print
+  print "%s  %8s  %s" % ("dataset".ljust(width), "seconds", "status")
+  for name, status, seconds, _ in results:
+    print "%s  %8.2f  %s" % (name.ljust(width), seconds, status)
+  failed = len([r for r in results if r[1] != 'ok'])
+  print "%s datasets, %s failed, %.2fs total" % (len(results), failed, elapsed)
+
+
+
 # Main
 # ----
 
-args = {'dataset':'picasso', 'verbose':False, 'concord':False}
+args = {'dataset':'picasso', 'verbose':False, 'concord':False, 'profile':False,
+        'incremental':False, 'backend':'nltk', 'ngramEngine':'dict', 'maxNgram':19,
+        'memoryBudget':64, 'ngrams':'all', 'index':False,
+        'ngramJobs':multiprocessing.cpu_count(), 'renderJobs':1, 'midiSettings':[12],
+        'vectorized':False}
 if __name__ == '__main__':
+  usage = """Usage: python parser.py [options] [--all | --dataset 'greeneggs' ... | 'green*' ...]
+  -v                          verbose output
+  --concord                   write a concordance file per word (else see concordance.py)
+  --jobs N                    process datasets in N worker processes
+  --clear-tag-cache           drop cached POS tags first
+  --profile                   write a per-stage timing report
+  --incremental               only redo what changed since the last run
+  --backend nltk|lite         language backend (lite never imports NLTK)
+  --ngram-engine dict|suffix|hash|stream|parallel
+                              how repeated n-grams are counted (hash needs NumPy)
+  --memory-budget MB          memory for --ngram-engine stream (default 64)
+  --ngram-jobs N              processes for --ngram-engine parallel (default: all cores)
+  --ngrams all|closed|maximal which repeats the n-gram JSON lists
+  --max-ngram N               longest n-gram reported (0 for no limit)
+  --index                     update the cross-dataset index (see corpusindex.py)
+  --midi-settings V[,V...]    settings versions to render (default 12)
+  --render-jobs N             render each MIDI file as a seeded job in N processes
+  --vectorized                compute the MIDI notes and timing with NumPy"""
   try:
-    opts, _args = getopt.getopt(sys.argv[1:], "d:v", ["dataset="])
+    opts, _args = getopt.getopt(sys.argv[1:], "d:v", ["dataset=", "concord", "all", "jobs=", "clear-tag-cache", "profile", "incremental", "backend=", "ngram-engine=", "max-ngram=", "memory-budget=", "ngrams=", "index", "ngram-jobs=", "midi-settings=", "render-jobs=", "vectorized"])
   except getopt.GetoptError, err:
     print str(err)
-    print "Usage: python parser.py -v --concord --dataset 'greeneggs'"
+    print usage
     sys.exit(2)
 
+  datasets = []
+  runall   = False
+  jobs     = 1
+  cleartags = False
   for o, a in opts:
     if o == "-v":
       args['verbose'] = True
-    elif o in ("--concord"):
+    elif o == "--concord":
       args['concord'] = True
     elif o in ("-d", "--dataset"):
       args['dataset'] = a        
+      datasets.append(a)
+    elif o == "--all":
+      runall = True
+    elif o == "--jobs":
+      jobs = int(a)
+    elif o == "--clear-tag-cache":
+      cleartags = True
+    elif o == "--profile":
+      args['profile'] = True
+    elif o == "--incremental":
+      args['incremental'] = True
+    elif o == "--backend":
+      args['backend'] = a
+    elif o == "--ngram-engine":
+      args['ngramEngine'] = a
+    elif o == "--max-ngram":
+      args['maxNgram'] = int(a)
+    elif o == "--memory-budget":
+      args['memoryBudget'] = int(a)
+    elif o == "--ngrams":
+      args['ngrams'] = a
+    elif o == "--index":
+      args['index'] = True
+    elif o == "--ngram-jobs":
+      args['ngramJobs'] = int(a)
+    elif o == "--midi-settings":
+      args['midiSettings'] = [int(v) for v in a.split(',')]
+    elif o == "--render-jobs":
+      args['renderJobs'] = int(a)
+    elif o == "--vectorized":
+      args['vectorized'] = True
 
   generate_files = True
-  pp = PoemParser(dataset=args['dataset'])
-  pp.runAll()
-
+  basedir = "parsed_data"
+
+  # Throw away cached POS tags, e.g. after installing a new tagger model.
+  if cleartags:
+    sharedTagCache(basedir, getBackend(args['backend']).tagger()).clear()
+
+  # Several datasets (or `--all`) are processed in one interpreter, with
+  # the NLTK models, word list and cmudict loaded only once.
+  if runall:
+    datasets = listDatasets(basedir)
+  else:
+    datasets = resolveDatasets(datasets + _args, basedir) or [args['dataset']]
+
+  if len(datasets) == 1 and not runall:
+    args['dataset'] = datasets[0]
+    pp = PoemParser(dataset=args['dataset'], basedir=basedir)
+    pp.runAll()
+    if args['index']:
+      indexDatasets(datasets, {args['dataset']:pp.loweredTokens}, basedir)
+  else:
+    start   = time.time()
+    results = runBatch(datasets, basedir, jobs)
+    printBatchSummary(results, time.time() - start)
+    if args['index']:
+      ok = [r for r in results if r[1] == 'ok']
+      indexDatasets([r[0] for r in ok], dict((r[0], r[3]) for r in ok), basedir)
+    if [r for r in results if r[1] != 'ok']:
+      sys.exit(1)
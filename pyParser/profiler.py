@@ -0,0 +1,163 @@
+# Stage profiler
+# --------------
+#
+# Records wall time, CPU time and peak memory for each stage of a
+# `PoemParser` run (imports, resource loading, tagging, n-grams, every
+# MIDI render, ...) so runs on different corpus sizes can be compared.
+# Stages nest: a lazily loaded resource shows up as a child of the stage
+# that first needed it.
+#
+# Memory is the peak resident size of the whole process, which is all
+# the OS reports: `process_peak_kb` after a stage, and `peak_grew_kb`,
+# how much a stage raised it. In a batch run the peak carries over from
+# the datasets processed before, so only the growth is per dataset.
+
+from contextlib import contextmanager
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+
+# Returns the peak resident set size of this process so far, in KB.
+def peakMemory():
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, OS X bytes.
+  if platform.system() == 'Darwin':
+    rss /= 1024
+  return rss
+
+
+# User + system CPU seconds used by this process so far.
+def cpuTime():
+  t = os.times()
+  return t[0] + t[1]
+
+
+#
+class StageProfiler(object):
+
+  enabled = True
+
+  #
+  def __init__(self):
+    self.stages  = []
+    self.depth   = 0
+    self.started = time.time()
+    self.cpu     = cpuTime()
+    self.imports = dict(_importTimes)
+    installImportTimer()
+
+
+  # Stops timing imports; call once the report has been written.
+  def close(self):
+    uninstallImportTimer()
+
+
+  # Times the enclosed block as stage `name`.
+  @contextmanager
+  def stage(self, name):
+    record = {'stage':name, 'depth':self.depth}
+    self.stages.append(record)
+    self.depth += 1
+    wall, cpu, peak = time.time(), cpuTime(), peakMemory()
+    try:
+      yield record
+    finally:
+      self.depth -= 1
+      record['wall']         = round(time.time() - wall, 6)
+      record['cpu']          = round(cpuTime() - cpu, 6)
+      record['process_peak_kb'] = peakMemory()
+      record['peak_grew_kb']    = record['process_peak_kb'] - peak
+
+
+  # Adds a stage that was timed elsewhere (e.g. module imports that
+  # happen before the profiler exists).
+  def add(self, name, wall):
+    self.stages.append({'stage':name, 'depth':self.depth, 'wall':round(wall, 6)})
+
+
+  # Returns the profile as a dict; `info` is included as is. Imports lists
+  # the modules first imported while this profiler was running.
+  def report(self, **info):
+    imports = [{'module':name, 'wall':round(wall - self.imports.get(name, 0), 6)}
+               for name, wall in _importTimes.items()
+               if wall > self.imports.get(name, 0)]
+    info.update({
+      'wall':    round(time.time() - self.started, 6),
+      'cpu':     round(cpuTime() - self.cpu, 6),
+      'process_peak_kb': peakMemory(),
+      'stages':  self.stages,
+      'imports': sorted(imports, key=lambda i: i['wall'], reverse=True),
+    })
+    return info
+
+
+  #
+  def dumps(self, **info):
+    return json.dumps(self.report(**info), indent=1, sort_keys=True)
+
+
+
+# Stands in for `StageProfiler` when profiling is off.
+class NullProfiler(object):
+
+  enabled = False
+
+  #
+  @contextmanager
+  def stage(self, name):
+    yield None
+
+  #
+  def add(self, name, wall):
+    pass
+
+  #
+  def close(self):
+    pass
+
+
+
+# Import timing
+# -------------
+
+# Seconds spent importing each module, counting only outermost imports so
+# a package's own imports aren't counted twice.
+_importTimes = {}
+_importDepth = [0]
+
+#
+def installImportTimer():
+  import __builtin__
+  original = __builtin__.__import__
+  if getattr(original, 'original', None) is not None:
+    return
+
+  def timedImport(name, *args, **kwargs):
+    if name in sys.modules or _importDepth[0]:
+      _importDepth[0] += 1
+      try:
+        return original(name, *args, **kwargs)
+      finally:
+        _importDepth[0] -= 1
+    start = time.time()
+    _importDepth[0] += 1
+    try:
+      return original(name, *args, **kwargs)
+    finally:
+      _importDepth[0] -= 1
+      _importTimes[name] = _importTimes.get(name, 0) + time.time() - start
+
+  timedImport.original = original
+  __builtin__.__import__ = timedImport
+
+
+# Puts back the `__import__` that `installImportTimer` replaced.
+def uninstallImportTimer():
+  import __builtin__
+  original = getattr(__builtin__.__import__, 'original', None)
+  if original is not None:
+    __builtin__.__import__ = original
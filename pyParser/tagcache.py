@@ -0,0 +1,123 @@
+# POS tag cache
+# -------------
+#
+# Part-of-speech tags memoized per line of source text, keyed by a hash
+# of the line's tokens, and persisted across runs and datasets. Poems
+# repeat lines a lot (`12days` is mostly the same few lines), so only new
+# or edited lines are ever handed to the tagger.
+#
+# Tagging a line on its own can tag a word at a line boundary differently
+# than tagging the whole text at once; for verse, where lines are the
+# natural units anyway, that's an acceptable trade.
+#
+# The cache remembers which tagger model filled it and starts over
+# whenever the model changes; `clear()` throws it away explicitly.
+
+import fcntl
+import hashlib
+import os
+
+from atomicfile import savePickle, loadPickle
+
+
+#
+class TagCache(object):
+
+  #
+  def __init__(self, path, model):
+    self.path    = path
+    self.model   = model
+    self.entries = self.load()
+    self.added   = {}
+    self.hits    = 0
+    self.misses  = 0
+
+
+  # Returns the cached entries on disk, or nothing if there are none for
+  # this tagger model.
+  def load(self):
+    data = loadPickle(self.path, {})
+    if data.get('model') != self.model:
+      return {}
+    return data['entries']
+
+
+  # Writes new entries back, merged with whatever other processes have
+  # saved in the meantime. Writers are serialized with a lock file and
+  # the cache is replaced atomically.
+  def save(self):
+    if not self.added:
+      return
+    dir = os.path.dirname(self.path)
+    if dir and not os.path.exists(dir):
+      os.makedirs(dir)
+
+    lock = open(self.path + '.lock', 'w')
+    try:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      entries = self.load()
+      entries.update(self.added)
+      savePickle(self.path, {'model':self.model, 'entries':entries})
+      self.entries.update(entries)
+      self.added = {}
+    finally:
+      fcntl.flock(lock, fcntl.LOCK_UN)
+      lock.close()
+
+
+  # Drops every cached entry, on disk and in memory.
+  def clear(self):
+    for path in (self.path, self.path + '.lock'):
+      if os.path.exists(path):
+        os.remove(path)
+    self.entries = {}
+    self.added   = {}
+
+
+  #
+  def key(self, tokens):
+    data = '\n'.join(tokens)
+    if not isinstance(data, bytes):
+      data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+  # Tags `tokens` with `tagger`, one line at a time (`lines[i]` is the
+  # source line of `tokens[i]`), reusing cached tags wherever the exact
+  # same line was tagged before.
+  def tag(self, tokens, lines, tagger):
+    ret = []
+    start = 0
+    for end in range(1, len(tokens)+1):
+      if end < len(tokens) and lines[end] == lines[start]:
+        continue
+      line = tokens[start:end]
+      key  = self.key(line)
+      tags = self.entries.get(key) or self.added.get(key)
+      if tags is None:
+        self.misses += 1
+        tags = self.added[key] = [pos for (word, pos) in tagger.tag(line)]
+      else:
+        self.hits += 1
+      ret.extend(zip(line, tags))
+      start = end
+    return ret
+
+
+  #
+  def stats(self):
+    total = self.hits + self.misses
+    return "%s lines cached, %s hits, %s misses (%d%% hit rate)" % (
+      len(self.entries) + len(self.added), self.hits, self.misses,
+      100 * self.hits / max(total, 1))
+
+
+# Returns a signature for a tagger model; the cache is invalidated
+# whenever it changes. Taggers may provide their own `signature`.
+def modelSignature(tagger):
+  signature = getattr(tagger, 'signature', None)
+  if signature:
+    return signature
+  import nltk
+  cls = tagger.__class__
+  return "%s.%s/nltk-%s" % (cls.__module__, cls.__name__, nltk.__version__)
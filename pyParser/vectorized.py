@@ -0,0 +1,129 @@
+# Vectorized rendering
+# --------------------
+#
+# The music algorithms of `PoemParser` decide how each token is played
+# one token at a time, drawing from `random` and looking up the settings
+# for every note. `--vectorized` makes the same decisions for a whole
+# render at once, as NumPy arrays computed from the columns of the token
+# feature table, with the random jitter drawn in bulk from a seeded
+# `RandomState`.
+#
+# The arrays follow the scalar algorithms rule for rule, so a vectorized
+# render has the same notes and the same timing and loudness
+# *distributions*; the individual jitter values differ, since they are
+# drawn in a different order. Every algorithm `getAlgoFunc` knows (1-5
+# and 7) has a vectorized version; velocity is the count loudness plus
+# the sentence end and pause boosts. The one piece of state the scalar
+# algorithms carry from token to token - algorithm 4's `lastspeed`, reset
+# at every sentence end and pause - becomes a forward fill.
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+from midirender import HOLD, OFF, OFF_RESET
+
+
+# A NumPy random generator seeded with `seed`.
+def randomState(seed):
+  if numpy is None:
+    raise ImportError("--vectorized needs NumPy")
+  return numpy.random.RandomState(seed)
+
+
+# `PoemParser.getNoteIndex` for every token of `order` (the `firstIndex`
+# or `firstOrder` column).
+def noteArray(order, startnote, settings):
+  order = numpy.asarray(order, dtype=numpy.int64)
+  if settings['direction'] == 'up':
+    notes = startnote + order
+  else:
+    notes = startnote - order
+  # Python's `%` and NumPy's agree for negative numbers.
+  return notes % settings['range'] + settings['offset']
+
+
+# `int(random()*span)+off` where `mask` is set, else 0: the sentence end
+# and pause times.
+def maskedTime(rng, mask, span, off):
+  return numpy.where(mask, (rng.random_sample(len(mask))*span).astype(numpy.int64) + off, 0)
+
+
+# `int(random()*randdist+randoffset+extra)` for every token.
+def jitter(rng, settings, n, extra=0):
+  return (rng.random_sample(n)*settings['randdist'] + settings['randoffset'] + extra).astype(numpy.int64)
+
+
+# Carries `values[i]` forward from every `i` where `mask` is set; entries
+# before the first one are `initial`.
+def forwardFill(values, mask, initial=0):
+  positions = numpy.where(mask, numpy.arange(len(mask)), -1)
+  last = numpy.maximum.accumulate(positions) if len(mask) else positions
+  return numpy.where(last >= 0, values[numpy.maximum(last, 0)], initial)
+
+
+# Returns `(channel, velocity, delta, off, lastspeed)` arrays for every
+# token of `features`, as `settings['algo']` would decide them; the last
+# entry is the `lastspeed` the render ends with. `rng` is a NumPy
+# `RandomState`. Raises ValueError for any other algorithm than 1-5 and 7.
+def decisionArrays(features, settings, rng, lastspeed=0):
+  if numpy is None:
+    raise ImportError("--vectorized needs NumPy")
+
+  algo = settings['algo']
+  n = len(features)
+  channel  = numpy.arange(n) % settings['numchannels']
+  count    = numpy.asarray(features.count, dtype=numpy.int64)
+  end      = numpy.asarray(features.sentenceEnd, dtype=bool)
+  pause    = numpy.asarray(features.sentencePause, dtype=bool)
+  syllables = (numpy.asarray(features.numsyl, dtype=numpy.int64) - 1)*100
+  truncate = settings['truncate']
+  off = numpy.zeros(n, dtype=numpy.int64)
+
+  # **Algorithm 1**
+  if algo == 1:
+    velocity = numpy.repeat(settings['loudness'], n)
+    return (channel, velocity, jitter(rng, settings, n), off, lastspeed)
+
+  # **Algorithm 2**
+  if algo == 2:
+    velocity = numpy.repeat(settings['loudness'], n)
+    delta = jitter(rng, settings, n, maskedTime(rng, end, 400, 100))
+    if truncate == 1:
+      off[:] = OFF
+    if truncate == 2:
+      off[rng.random_sample(n) < .5] = OFF
+    return (channel, velocity, delta, off, lastspeed)
+
+  if truncate:
+    off[count % truncate != 0] = OFF_RESET
+
+  # **Algorithm 3**
+  if algo == 3:
+    extratime = maskedTime(rng, end, 400, 100) + maskedTime(rng, pause, 300, 80) + syllables
+    velocity  = settings['loudness'] - 40 + 2*count
+    return (channel, velocity, jitter(rng, settings, n, extratime), off, lastspeed)
+
+  # **Algorithm 4** and its variants (see `__algo4_base`): 5 ignores
+  # punctuation and counts.
+  if algo not in (4, 5, 7):
+    raise ValueError("no vectorized algorithm %s" % algo)
+  extraloud = numpy.zeros(n, dtype=numpy.int64)
+  extratime = numpy.zeros(n, dtype=numpy.int64)
+  if algo == 5:
+    count = numpy.zeros(n, dtype=numpy.int64)
+    off[:] = HOLD
+    speed = numpy.repeat(lastspeed, n)
+  else:
+    # A pause overrides a sentence end on the same token, as the scalar
+    # algorithm's second assignments do; the end's time is dropped.
+    extraloud[end]   = 15
+    extraloud[pause] = 10
+    extratime = maskedTime(rng, pause, 150, 100)
+    reset = end | pause
+    speed = forwardFill(jitter(rng, settings, n), reset, lastspeed)
+  extratime += syllables + (rng.random_sample(n)*10).astype(numpy.int64)
+  velocity = numpy.minimum(settings['loudness'] - 40 + 2*count + extraloud, 255)
+  lastspeed = int(speed[-1]) if n else lastspeed
+  return (channel, velocity, speed + extratime, off, lastspeed)